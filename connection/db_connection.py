@@ -3,6 +3,7 @@ import urllib.parse
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from connection.instrumentacao import CursorMedido, PoolMedido, instrumentar_engine
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -13,13 +14,25 @@ DB_PASSWORD = urllib.parse.quote_plus(os.getenv("DB_PASSWORD"))  # <-- codifica
 DB_NAME = os.getenv("DB_NAME")
 DB_PORT = os.getenv("DB_PORT", "3306")
 
+# LOAD DATA LOCAL INFILE na carga de produtos (precisa de local_infile=ON no servidor)
+DB_LOCAL_INFILE = os.getenv("DB_LOCAL_INFILE", "0") == "1"
+
+# pool por worker do uvicorn (padrões do SQLAlchemy: 5 + 10 de overflow)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
-    pool_recycle=280
+    pool_recycle=280,
+    poolclass=PoolMedido,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"cursorclass": CursorMedido, "local_infile": DB_LOCAL_INFILE}
 )
+instrumentar_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
\ No newline at end of file
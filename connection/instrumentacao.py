@@ -0,0 +1,90 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+import pymysql.cursors
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# ------------------------------------------------------
+# ESTATÍSTICAS SQL POR REQUISIÇÃO
+# ------------------------------------------------------
+# O middleware abre a medição no início da requisição; tudo o que rodar no
+# mesmo contexto (inclusive no threadpool das rotas síncronas) soma aqui.
+_estatisticas: ContextVar[Optional[dict]] = ContextVar("estatisticas_sql", default=None)
+
+
+def iniciar_medicao() -> dict:
+    estatisticas = {"sql_statements": 0, "sql_rows": 0, "sql_ms": 0.0}
+    _estatisticas.set(estatisticas)
+    return estatisticas
+
+
+def registrar(duracao: float, linhas: int):
+    estatisticas = _estatisticas.get()
+    if estatisticas is None:
+        return
+
+    estatisticas["sql_statements"] += 1
+    estatisticas["sql_ms"] += duracao * 1000
+    # cursores sem buffer (SSCursor) não sabem o total de linhas na execução
+    if linhas is not None and 0 <= linhas < 2 ** 62:
+        estatisticas["sql_rows"] += linhas
+
+
+class CursorMedido(pymysql.cursors.Cursor):
+    """
+    Cursor padrão das conexões do pool. Mede os cursor.execute feitos direto
+    na conexão crua (db.connection().connection); as execuções do SQLAlchemy
+    já são medidas pelos eventos do engine e não contam de novo.
+    """
+
+    _medido_fora = False
+
+    def execute(self, query, args=None):
+        if self._medido_fora:
+            return super().execute(query, args)
+        return self._medir(super().execute, query, args)
+
+    def executemany(self, query, args):
+        if self._medido_fora:
+            return super().executemany(query, args)
+        return self._medir(super().executemany, query, args)
+
+    def _medir(self, executar, query, args):
+        if _estatisticas.get() is None:
+            return executar(query, args)
+
+        # executemany chama execute por dentro: conta uma vez só
+        self._medido_fora = True
+        inicio = time.perf_counter()
+        try:
+            return executar(query, args)
+        finally:
+            self._medido_fora = False
+            registrar(time.perf_counter() - inicio, self.rowcount)
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que informa quanto tempo cada checkout esperou por conexão."""
+
+    observar_espera = None
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.observar_espera is not None:
+                self.observar_espera(time.perf_counter() - inicio)
+
+
+def instrumentar_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def antes_execucao(conn, cursor, statement, parameters, context, executemany):
+        cursor._medido_fora = True
+        context._inicio_medicao = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def depois_execucao(conn, cursor, statement, parameters, context, executemany):
+        cursor._medido_fora = False
+        registrar(time.perf_counter() - context._inicio_medicao, cursor.rowcount)
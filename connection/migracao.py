@@ -0,0 +1,20 @@
+"""
+Migração das colunas e índices que não são mapeados pelo ORM
+(connection.schema.COLUNAS / INDICES).
+
+Rodar uma vez, fora dos workers da API, antes de subir a versão nova:
+
+    python -m connection.migracao
+
+Os índices são criados online; a coluna STORED whsproducts.content_hash
+regrava a tabela inteira, então a primeira execução deve ser numa janela
+de manutenção.
+"""
+import logging
+from connection.db_connection import engine
+from connection.schema import garantir_schema
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    garantir_schema(engine)
+    logging.getLogger("schema").info("[SCHEMA] migração concluída")
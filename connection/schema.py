@@ -0,0 +1,180 @@
+import zlib
+import hashlib
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger("schema")
+
+# ------------------------------------------------------
+# HASH DE CONTEÚDO DO PRODUTO
+# ------------------------------------------------------
+# Mesma normalização da comparação antiga (COALESCE + TRIM + UPPER), com os
+# campos separados por CHAR(31) e convertidos para utf8mb4 para que o hash
+# da whsproducts e o da staging batam independente do charset das tabelas.
+CAMPOS_HASH_PRODUTO = ("Description", "Position", "PositionAux", "SiCcode")
+
+
+def expressao_hash_produto(alias: str = "") -> str:
+    prefixo = f"{alias}." if alias else ""
+    campos = ", ".join(
+        f"UPPER(TRIM(COALESCE(CONVERT({prefixo}{campo} USING utf8mb4), '')))"
+        for campo in CAMPOS_HASH_PRODUTO
+    )
+    return f"MD5(CONCAT_WS(CHAR(31 USING utf8mb4), {campos}))"
+
+
+def hash_produto(description, position, position_aux, siccode) -> str:
+    """Mesmo valor de whsproducts.content_hash, calculado em Python."""
+    # TRIM do MySQL tira só espaços (não tabs/quebras de linha)
+    campos = [(valor or "").strip(" ").upper() for valor in (description, position, position_aux, siccode)]
+    return hashlib.md5("\x1f".join(campos).encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------------
+# BALDES (sincronização delta do catálogo)
+# ------------------------------------------------------
+# Cada PN cai no balde CRC32(PN) % n. O hash do balde é o XOR dos primeiros
+# 64 bits de MD5(PN + CHAR(31) + content_hash) de cada PN: não depende da
+# ordem e não tem limite de tamanho (ao contrário do GROUP_CONCAT).
+BALDE_VAZIO = "0" * 16
+
+
+def expressao_balde_produto(buckets: int, alias: str = "") -> str:
+    prefixo = f"{alias}." if alias else ""
+    return f"CRC32(CONVERT({prefixo}PN USING utf8mb4)) % {int(buckets)}"
+
+
+def expressao_hash_balde(alias: str = "") -> str:
+    prefixo = f"{alias}." if alias else ""
+    item = f"MD5(CONCAT_WS(CHAR(31 USING utf8mb4), CONVERT({prefixo}PN USING utf8mb4), {prefixo}content_hash))"
+    return f"LPAD(LOWER(HEX(BIT_XOR(CAST(CONV(LEFT({item}, 16), 16, 10) AS UNSIGNED)))), 16, '0')"
+
+
+def balde_produto(pn: str, buckets: int) -> int:
+    return zlib.crc32(pn.encode("utf-8")) % buckets
+
+
+def hash_balde(pares) -> str:
+    """pares: (PN, content_hash) de um balde -> mesmo valor de expressao_hash_balde()."""
+    acumulado = 0
+    for pn, content_hash in pares:
+        item = hashlib.md5(f"{pn}\x1f{content_hash}".encode("utf-8")).hexdigest()
+        acumulado ^= int(item[:16], 16)
+    return format(acumulado, "016x")
+
+
+# ------------------------------------------------------
+# COLUNAS DERIVADAS
+# ------------------------------------------------------
+# Chaves de busca já normalizadas (TRIM) como colunas geradas INVISIBLE:
+# o MySQL mantém o valor sozinho em todo INSERT/UPDATE, elas não aparecem
+# nos SELECT * das rotas e podem ser indexadas (MySQL 8.0.23+).
+COLUNAS = [
+    ("whsproductsputaway", "ReferenceKey", "VARCHAR(255) AS (TRIM(Reference)) VIRTUAL INVISIBLE"),
+    ("whsproductsputaway", "WaybillKey", "VARCHAR(255) AS (TRIM(Waybill)) VIRTUAL INVISIBLE"),
+    ("whsproductsputaway", "PNKey", "VARCHAR(255) AS (TRIM(PN)) VIRTUAL INVISIBLE"),
+    ("whsproductsputawaylog", "ReferenceKey", "VARCHAR(255) AS (TRIM(Reference)) VIRTUAL INVISIBLE"),
+    ("whsproductsputawaylog", "WaybillKey", "VARCHAR(255) AS (TRIM(Waybill)) VIRTUAL INVISIBLE"),
+    ("whsproductsputawaylog", "PNKey", "VARCHAR(255) AS (TRIM(PN)) VIRTUAL INVISIBLE"),
+    # instrumentação SQL por requisição (MovLogMiddleware)
+    ("movlog", "sql_statements", "INT NULL"),
+    ("movlog", "sql_rows", "BIGINT NULL"),
+    ("movlog", "sql_ms", "INT NULL"),
+    # classificação do /products por hash (só atualiza o que mudou)
+    ("whsproducts", "content_hash", f"CHAR(32) AS ({expressao_hash_produto()}) STORED"),
+    # staging isolado por importação (várias importações em paralelo)
+    ("staging_products", "lote_id", "VARCHAR(36) NULL"),
+    # idade das linhas da staging (lote abandonado por importação com erro)
+    ("staging_products", "criado_em", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    ("whsaurora071", "lote_id", "VARCHAR(36) NULL"),
+    ("whsauroraaaf", "lote_id", "VARCHAR(36) NULL"),
+    # processo dono de cada job (marcar só os órfãos na subida)
+    ("whsjobs", "dono", "VARCHAR(100) NULL"),
+]
+
+# ------------------------------------------------------
+# ÍNDICES
+# ------------------------------------------------------
+# criados online (INPLACE, sem travar escrita); a coluna STORED
+# content_hash não tem essa opção e regrava a whsproducts inteira
+INDICES = [
+    ("whsproductsputaway", "idx_putaway_ref_way_pn", "ReferenceKey, WaybillKey, PNKey"),
+    ("whsproductsputaway", "idx_putaway_ref_pn", "ReferenceKey, PNKey"),
+    ("whsproductsputawaylog", "idx_putawaylog_ref_way_pn", "ReferenceKey, WaybillKey, PNKey"),
+    ("whsproductsputawaylog", "idx_putawaylog_ref_pn", "ReferenceKey, PNKey"),
+    ("staging_products", "idx_staging_products_lote", "lote_id"),
+    ("whsaurora071", "idx_aurora071_lote", "lote_id"),
+    ("whsauroraaaf", "idx_auroraaaf_lote", "lote_id"),
+    ("whsjobs", "ix_whsjobs_dono", "dono"),
+    # atualização incremental do catálogo em memória (wsh.consulta.catalogo)
+    ("whsproducts", "idx_whsproducts_dateregistration", "dateregistration"),
+    # keyset da /listageral nas ordens usadas pelas grades (PN, Reference):
+    # colunas que não mudam depois do INSERT, então não pesam nas gravações.
+    # As demais ordens fazem filesort só do intervalo filtrado.
+    ("whsproductsputaway", "idx_putaway_ord_pn", "PN, Id"),
+    ("whsproductsputaway", "idx_putaway_ord_reference", "Reference, Id"),
+    ("whsproductsputawaylog", "idx_putawaylog_ord_pn", "PN, Id"),
+    ("whsproductsputawaylog", "idx_putawaylog_ord_reference", "Reference, Id"),
+]
+
+
+def coluna_existe(conn, tabela, coluna):
+    return conn.execute(text("""
+        SELECT COUNT(*)
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :tabela
+          AND COLUMN_NAME = :coluna
+    """), {"tabela": tabela, "coluna": coluna}).scalar() > 0
+
+
+def indice_existe(conn, tabela, indice):
+    return conn.execute(text("""
+        SELECT COUNT(*)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :tabela
+          AND INDEX_NAME = :indice
+    """), {"tabela": tabela, "indice": indice}).scalar() > 0
+
+
+# coluna / índice já existe: outra execução chegou antes, conta como feito
+ERROS_JA_EXISTE = {1060, 1061}
+
+
+def _alterar(conn, sql: str):
+    try:
+        conn.execute(text(sql))
+    except DBAPIError as e:
+        codigo = e.orig.args[0] if e.orig is not None and e.orig.args else None
+        if codigo not in ERROS_JA_EXISTE:
+            raise
+        logger.info(f"[SCHEMA] já existe, ignorado: {e.orig}")
+
+
+def garantir_schema(engine):
+    """
+    Aplica as colunas e índices que não são mapeados pelo ORM.
+    Idempotente: só executa o ALTER TABLE do que ainda não existe.
+
+    Não é chamado pela API: roda uma vez, fora dos workers, pelo script de
+    migração (python -m connection.migracao).
+    """
+    with engine.connect() as conn:
+        for tabela, coluna, definicao in COLUNAS:
+            if not coluna_existe(conn, tabela, coluna):
+                logger.info(f"[SCHEMA] criando coluna {tabela}.{coluna}")
+                _alterar(conn, f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+        for tabela, indice, colunas in INDICES:
+            faltando = [c.strip() for c in colunas.split(",") if not coluna_existe(conn, tabela, c.strip())]
+            if faltando:
+                logger.warning(f"[SCHEMA] índice {tabela}.{indice} ignorado, coluna(s) inexistente(s): {faltando}")
+                continue
+
+            if not indice_existe(conn, tabela, indice):
+                logger.info(f"[SCHEMA] criando índice {tabela}.{indice}")
+                _alterar(conn, f"ALTER TABLE {tabela} ADD INDEX {indice} ({colunas}), ALGORITHM=INPLACE, LOCK=NONE")
+
+        conn.commit()
@@ -4,8 +4,13 @@ from wsh.cadastro.products import products_rp
 from wsh.consulta.consultasgerais import consults_rp
 from wsh.consulta.products import consult_prod_rp
 from wsh.consulta.consultawhsmovementputaway import consult_mov_putaway
+from wsh.jobs.jobs import jobs_rp, marcar_jobs_interrompidos, encerrar_jobs
 from wsh.listagem.listamovimento import listagem_rp
-from wsh.middleware.log import MovLogMiddleware
+from wsh.middleware.compressao import CompressaoMiddleware
+from wsh.middleware.descompressao import DescompressaoMiddleware
+from wsh.middleware.log import MovLogMiddleware, movlog_writer
+from wsh.middleware.metricas import MetricsMiddleware
+from wsh.metrics.metrics import metrics_rp, registrar_pool, registrar_fila_movlog
 from wsh.movimento.a020_a190 import a020_a190_rp
 from wsh.movimento.acompanhamento import acompanhamento_rp
 from wsh.movimento.cancelarmovimento import cancelputway_rp
@@ -21,9 +26,16 @@ app = FastAPI()
 
 # Cria tabelas (se quiser)
 Base.metadata.create_all(bind=engine)
+# colunas/índices fora do ORM: python -m connection.migracao (uma vez, antes do deploy)
 
 
+registrar_pool(engine)
+registrar_fila_movlog(movlog_writer)
+
+app.add_middleware(DescompressaoMiddleware)
+app.add_middleware(CompressaoMiddleware)
 app.add_middleware(MovLogMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(login_rp, prefix="", tags=["Login"])
 app.include_router(user_rp, prefix="", tags=["users"])
 app.include_router(products_rp, prefix="", tags=["products"])
@@ -38,6 +50,8 @@ app.include_router(a020_a190_rp, prefix="", tags=["a020 a190"])
 app.include_router(putway_rp, prefix="", tags=["finish process"])
 app.include_router(cancelputway_rp, prefix="", tags=["cancel putway"])
 app.include_router(api_rp, prefix="", tags=["api"])
+app.include_router(jobs_rp, prefix="", tags=["jobs"])
+app.include_router(metrics_rp, prefix="", tags=["metrics"])
 
 
 @app.get("/")
@@ -53,6 +67,8 @@ def get_db():
 
 @app.on_event("startup")
 def startup_event():
+    movlog_writer.iniciar()
+
     db = SessionLocal()
     try:
         last_version = db.query(Version).order_by(Version.id.desc()).first()
@@ -74,6 +90,13 @@ def startup_event():
     finally:
         db.close()
 
+    marcar_jobs_interrompidos()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    encerrar_jobs()
+    movlog_writer.parar()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from models.version import Version
+from models.job import Job
 
-__all__ = ["Version"]
+__all__ = ["Version", "Job"]
 
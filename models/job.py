@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, BigInteger, Text, DateTime, func
+from connection.db_connection import Base
+
+class Job(Base):
+    __tablename__ = "whsjobs"
+
+    id = Column(String(36), primary_key=True)
+    rota = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default="QUEUED", index=True)
+    fase = Column(String(100), nullable=True)
+    dono = Column(String(100), nullable=True, index=True)  # host:pid do worker que executa
+    linhas_processadas = Column(BigInteger, nullable=False, default=0)
+    resultado = Column(Text, nullable=True)
+    erro = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
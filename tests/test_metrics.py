@@ -0,0 +1,141 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from wsh.metrics.metrics import metrics_rp, http_duracao, listageral_linhas, Histograma, Registro
+from wsh.middleware.metricas import MetricsMiddleware
+from wsh.middleware.descompressao import DescompressaoMiddleware
+
+parser = pytest.importorskip("prometheus_client.parser")
+
+
+# ------------------------------------------------------
+# APOIO
+# ------------------------------------------------------
+def coletar(client) -> dict:
+    """Faz o scrape de /metrics e devolve {nome da família: família}."""
+    resposta = client.get("/metrics")
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return {f.name: f for f in parser.text_string_to_metric_families(resposta.text)}
+
+
+def amostras(familia, nome, **rotulos) -> list:
+    return [
+        a for a in familia.samples
+        if a.name == nome and all(a.labels.get(k) == v for k, v in rotulos.items())
+    ]
+
+
+@pytest.fixture
+def client():
+    # mesma ordem do main.py: métricas por fora da descompressão
+    app = FastAPI()
+    app.add_middleware(DescompressaoMiddleware, rotas={"/eco"})
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_rp)
+
+    @app.get("/item/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    @app.post("/eco")
+    async def eco(request: Request):
+        return {"tamanho": len(await request.body())}
+
+    return TestClient(app)
+
+
+# ------------------------------------------------------
+# TESTES
+# ------------------------------------------------------
+def test_histograma_http_por_template_da_rota(client):
+    antes = coletar(client)["wsh_http_request_duration_seconds"]
+    total_antes = sum(
+        a.value for a in amostras(antes, "wsh_http_request_duration_seconds_count", route="/item/{item_id}")
+    )
+
+    for item_id in (1, 2, 3):
+        assert client.get(f"/item/{item_id}").status_code == 200
+
+    familia = coletar(client)["wsh_http_request_duration_seconds"]
+    assert familia.type == "histogram"
+
+    rotulos = {"method": "GET", "route": "/item/{item_id}", "status": "200"}
+    (contagem,) = amostras(familia, "wsh_http_request_duration_seconds_count", **rotulos)
+    assert contagem.value - total_antes == 3
+
+    # nenhum rótulo com o path cru
+    assert not [a for a in familia.samples if a.labels.get("route", "").startswith("/item/1")]
+
+    buckets = amostras(familia, "wsh_http_request_duration_seconds_bucket", **rotulos)
+    assert [b.labels["le"] for b in buckets][-1] == "+Inf"
+    assert len(buckets) == len(http_duracao.buckets) + 1
+
+    valores = [b.value for b in buckets]
+    assert valores == sorted(valores)  # buckets acumulados
+    assert valores[-1] == contagem.value
+
+    (soma,) = amostras(familia, "wsh_http_request_duration_seconds_sum", **rotulos)
+    assert soma.value > 0
+
+
+def test_rota_inexistente_nao_usa_path_cru(client):
+    assert client.get("/nao/existe/123").status_code == 404
+
+    familia = coletar(client)["wsh_http_request_duration_seconds"]
+    assert amostras(familia, "wsh_http_request_duration_seconds_count", route="<sem rota>", status="404")
+    assert not amostras(familia, "wsh_http_request_duration_seconds_count", route="/nao/existe/123")
+
+
+def test_contador_e_medidor(client):
+    familias = coletar(client)
+    (antes,) = familias["wsh_listageral_rows_streamed"].samples
+
+    listageral_linhas.inc(250)
+
+    familias = coletar(client)
+    familia = familias["wsh_listageral_rows_streamed"]
+    assert familia.type == "counter"
+    (depois,) = familia.samples
+    assert depois.name == "wsh_listageral_rows_streamed_total"
+    assert depois.value - antes.value == 250
+
+    # o próprio scrape está em andamento quando o texto é gerado
+    (em_andamento,) = familias["wsh_http_requests_in_flight"].samples
+    assert familias["wsh_http_requests_in_flight"].type == "gauge"
+    assert em_andamento.value == 1
+
+
+def test_buckets_do_histograma():
+    registro = Registro()
+    histograma = registro.registrar(Histograma("teste_segundos", "Teste", rotulos=("rota",), buckets=(0.1, 1.0, 10.0)))
+
+    for valor in (0.05, 0.1, 0.5, 2.0, 20.0):
+        histograma.observar(valor, "/x")
+
+    (familia,) = parser.text_string_to_metric_families(registro.expor())
+    buckets = {a.labels["le"]: a.value for a in familia.samples if a.name == "teste_segundos_bucket"}
+
+    # le é inclusivo: 0.1 cai no bucket 0.1
+    assert buckets == {"0.1": 2, "1.0": 3, "10.0": 4, "+Inf": 5}
+    (contagem,) = amostras(familia, "teste_segundos_count", rota="/x")
+    (soma,) = amostras(familia, "teste_segundos_sum", rota="/x")
+    assert contagem.value == 5
+    assert soma.value == pytest.approx(22.65)
+
+
+def test_corpo_gzip_mantem_o_rotulo_da_rota(client):
+    corpo = b"x" * 10000
+    resposta = client.post("/eco", content=gzip.compress(corpo), headers={"Content-Encoding": "gzip"})
+    assert resposta.json() == {"tamanho": len(corpo)}
+
+    familia = coletar(client)["wsh_http_request_duration_seconds"]
+    assert amostras(familia, "wsh_http_request_duration_seconds_count", route="/eco", status="200")
+
+
+def test_bytes_depois_do_fim_do_gzip(client):
+    resposta = client.post("/eco", content=gzip.compress(b"abc") + b"lixo", headers={"Content-Encoding": "gzip"})
+    assert resposta.status_code == 400
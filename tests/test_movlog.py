@@ -0,0 +1,138 @@
+import os
+import json
+import time
+from datetime import datetime, timedelta
+
+import pymysql.converters
+import pymysql.cursors
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects.mysql import pymysql as dialeto_pymysql
+
+os.environ.setdefault("DB_PASSWORD", "x")
+
+from wsh.middleware import log  # noqa: E402
+
+
+# ------------------------------------------------------
+# APOIO
+# ------------------------------------------------------
+class ConexaoFalsa:
+    """O mínimo que o Cursor do PyMySQL usa para montar o SQL."""
+    encoding = "utf8"
+
+    def literal(self, valor):
+        return pymysql.converters.escape_item(valor, "utf8")
+
+    escape = literal
+
+
+class CursorGravador(pymysql.cursors.Cursor):
+    """Grava os comandos que iriam ao servidor em vez de enviá-los."""
+
+    def __init__(self):
+        super().__init__(ConexaoFalsa())
+        self.comandos = []
+
+    def _get_db(self):
+        return self.connection
+
+    def execute(self, query, args=None):
+        self.comandos.append(query if args is None else self.mogrify(query, args))
+        return 1
+
+
+def registro(n, enfileirado_em):
+    return {
+        "rota": f"/rota/{n}", "ins": n, "upd": 0, "total": n, "usuario": None,
+        "descricao": None, "status": "SUCCESS", "tempo": 10, "sql_statements": 1,
+        "sql_rows": n, "sql_ms": 2, "enfileirado_em": enfileirado_em
+    }
+
+
+# ------------------------------------------------------
+# TESTES
+# ------------------------------------------------------
+def test_flush_vira_um_insert_de_varias_linhas():
+    # o mesmo SQL e os mesmos parâmetros que o SQLAlchemy entrega ao PyMySQL
+    compilado = text(log.INSERT_MOVLOG_SQL).compile(dialect=dialeto_pymysql.dialect())
+    sql = str(compilado)
+    assert pymysql.cursors.RE_INSERT_VALUES.match(sql), "VALUES precisa ser só de parâmetros"
+
+    relogio = (datetime(2026, 1, 1, 12, 0, 0), time.time())
+    lote = [log.parametros_movlog(registro(n, relogio[1]), relogio) for n in range(1, 6)]
+
+    cursor = CursorGravador()
+    cursor.executemany(sql, [tuple(p[nome] for nome in compilado.positiontup) for p in lote])
+
+    assert len(cursor.comandos) == 1
+    comando = bytes(cursor.comandos[0]).decode()
+    assert comando.count("'/rota/") == 5
+
+
+def test_data_hora_desconta_o_tempo_na_fila():
+    agora_banco = datetime(2026, 1, 1, 12, 0, 0)
+    agora_local = 1_000_000.0
+
+    parametros = log.parametros_movlog(registro(1, agora_local - 2.5), (agora_banco, agora_local))
+    assert parametros["data_hora"] == agora_banco - timedelta(seconds=2.5)
+
+    # relógio local adiantado em relação ao enfileiramento não gera data no futuro
+    parametros = log.parametros_movlog(registro(1, agora_local + 10), (agora_banco, agora_local))
+    assert parametros["data_hora"] == agora_banco
+
+
+class SessaoFalsa:
+    def __init__(self, gravados, recusar=()):
+        self.gravados = gravados
+        self.recusar = recusar
+
+    def execute(self, sql, parametros=None):
+        if parametros is None:
+            return self
+        if parametros["rota"] in self.recusar:
+            raise ValueError("recusado pelo banco")
+        self.gravados.append(parametros["rota"])
+
+    def scalar(self):
+        return datetime(2026, 1, 1)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_replay_do_spill_com_linha_cortada(tmp_path, monkeypatch):
+    spill = tmp_path / "movlog_spill.jsonl"
+    rejeitados = tmp_path / "movlog_spill.jsonl.rejeitados"
+    monkeypatch.setattr(log, "MOVLOG_SPILL_FILE", str(spill))
+    monkeypatch.setattr(log, "MOVLOG_REJEITADOS_FILE", str(rejeitados))
+
+    linhas = [json.dumps(registro(n, time.time())) for n in (1, 2, 3)]
+    spill.write_text(linhas[0] + "\n" + linhas[1] + "\n" + linhas[2] + "\n" + linhas[2][:20], encoding="utf-8")
+
+    gravados = []
+    monkeypatch.setattr(log, "SessionLocal", lambda: SessaoFalsa(gravados, recusar={"/rota/2"}))
+
+    writer = log.MovLogWriter()
+    writer._spill = lambda *a, **k: pytest.fail("nada deve voltar ao spill")
+    writer._recuperar_spill()
+
+    assert gravados == ["/rota/1", "/rota/3"]
+    recusados = rejeitados.read_text(encoding="utf-8").splitlines()
+    assert recusados == [linhas[1], linhas[2][:20]]
+    assert not spill.exists()
+    assert not list(tmp_path.glob("*.replay"))
+
+
+def test_erro_no_replay_nao_derruba_a_thread(monkeypatch):
+    writer = log.MovLogWriter()
+    monkeypatch.setattr(writer, "_recuperar_spill", lambda: 1 / 0)
+    writer._parar.set()
+
+    writer._loop()  # não propaga
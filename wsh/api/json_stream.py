@@ -0,0 +1,131 @@
+import json
+import codecs
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+# ------------------------------------------------------
+# LEITURA INCREMENTAL DE ARRAYS JSON
+# ------------------------------------------------------
+# O corpo é lido do request.stream() e cada item do array é decodificado
+# assim que chega (json.raw_decode sobre um buffer). Só o item atual e o
+# pedaço ainda não lido ficam em memória, nunca o payload inteiro.
+_decoder = json.JSONDecoder()
+_ESPACOS = " \t\r\n"
+ITEM_MAX = 1024 * 1024  # um item maior que isso é tratado como JSON inválido
+
+
+class _Leitor:
+    def __init__(self, stream):
+        self.stream = stream.__aiter__()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.fim = False
+
+    async def ler_mais(self) -> bool:
+        if self.fim:
+            return False
+        try:
+            pedaco = await self.stream.__anext__()
+            self.buffer = self.buffer[self.pos:] + self.utf8.decode(pedaco)
+        except StopAsyncIteration:
+            self.buffer = self.buffer[self.pos:] + self.utf8.decode(b"", final=True)
+            self.fim = True
+        self.pos = 0
+        return True
+
+    async def pular_espacos(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _ESPACOS:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not await self.ler_mais():
+                return
+
+    async def caractere(self) -> str:
+        await self.pular_espacos()
+        if self.pos >= len(self.buffer):
+            raise HTTPException(status_code=400, detail="JSON incompleto")
+        return self.buffer[self.pos]
+
+    async def esperar(self, esperado: str):
+        atual = await self.caractere()
+        if atual != esperado:
+            raise HTTPException(status_code=400, detail=f"JSON inválido: esperado '{esperado}', veio '{atual}'")
+        self.pos += 1
+
+    async def valor(self):
+        await self.pular_espacos()
+        while True:
+            try:
+                valor, fim = _decoder.raw_decode(self.buffer, self.pos)
+                # um número no fim do buffer pode continuar no próximo pedaço
+                if fim < len(self.buffer) or self.fim:
+                    self.pos = fim
+                    return valor
+            except json.JSONDecodeError as e:
+                if self.fim or len(self.buffer) - self.pos > ITEM_MAX:
+                    raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+            await self.ler_mais()
+
+
+async def itens_json(stream, chave: str = None):
+    """
+    Gera os itens de um array JSON lido aos poucos de `stream`.
+
+    Sem chave o corpo é o próprio array ([...]); com chave, o array está no
+    campo `chave` de um objeto ({"produtos": [...]}). Os demais campos do
+    objeto são lidos e descartados.
+    """
+    leitor = _Leitor(stream)
+
+    if chave is not None:
+        await leitor.esperar("{")
+        while True:
+            if await leitor.caractere() == "}":
+                raise HTTPException(status_code=400, detail=f"Campo '{chave}' não encontrado")
+            nome = await leitor.valor()
+            await leitor.esperar(":")
+            if nome == chave:
+                break
+            await leitor.valor()
+            if await leitor.caractere() == ",":
+                leitor.pos += 1
+
+    await leitor.esperar("[")
+
+    if await leitor.caractere() == "]":
+        leitor.pos += 1
+        return
+
+    while True:
+        yield await leitor.valor()
+
+        separador = await leitor.caractere()
+        leitor.pos += 1
+        if separador == "]":
+            return
+        if separador != ",":
+            raise HTTPException(status_code=400, detail=f"JSON inválido: esperado ',' ou ']', veio '{separador}'")
+
+
+async def lotes_validados(itens, modelo, tamanho: int):
+    """Valida cada item com o modelo pydantic e entrega listas de até `tamanho`."""
+    lote = []
+    indice = 0
+
+    async for item in itens:
+        try:
+            lote.append(modelo.model_validate(item))
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail={"item": indice, "erros": e.errors(include_url=False, include_context=False)}
+            )
+        indice += 1
+
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+
+    if lote:
+        yield lote
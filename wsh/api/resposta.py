@@ -0,0 +1,65 @@
+from decimal import Decimal
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine import Row, RowMapping
+
+# ------------------------------------------------------
+# RESPOSTAS JSON COM ORJSON
+# ------------------------------------------------------
+# datetime/date/None/números saem direto do orjson (em C); o `default` só
+# é chamado para o que ele não conhece: Decimal e as linhas do SQLAlchemy.
+
+
+def _decimal_numero(valor: Decimal):
+    # mesmo critério do jsonable_encoder: inteiro quando não há casas decimais
+    if valor.as_tuple().exponent >= 0:
+        return int(valor)
+    return float(valor)
+
+
+def _padrao(valor, decimal_texto: bool):
+    if isinstance(valor, Decimal):
+        return str(valor) if decimal_texto else _decimal_numero(valor)
+    if isinstance(valor, Row):
+        return tuple(valor)
+    if isinstance(valor, RowMapping):
+        return dict(valor)
+    return str(valor)
+
+
+def _padrao_numero(valor):
+    return _padrao(valor, False)
+
+
+def _padrao_texto(valor):
+    return _padrao(valor, True)
+
+
+def dumps(conteudo, decimal_texto: bool = False, datas_texto: bool = False) -> bytes:
+    """
+    Serializa com orjson.
+
+    decimal_texto -> Decimal como string ("12.50"), senão número.
+    datas_texto   -> datetime/date via str() ("2024-01-02 03:04:05"), como o
+                     json.dumps(default=str) antigo; senão ISO 8601.
+    """
+    # com OPT_PASSTHROUGH_DATETIME as datas caem no default -> str(valor)
+    opcoes = orjson.OPT_PASSTHROUGH_DATETIME if datas_texto else 0
+    padrao = _padrao_texto if decimal_texto else _padrao_numero
+
+    return orjson.dumps(conteudo, default=padrao, option=opcoes)
+
+
+class ORJSONResposta(JSONResponse):
+    """
+    Resposta JSON via orjson. Aceita Row (vira array) e row._mapping (vira
+    objeto) sem passar pelo jsonable_encoder.
+
+    Deve ser devolvida pela rota (return ORJSONResposta(...)): se a rota
+    devolver um dict, o FastAPI roda o jsonable_encoder antes de chegar aqui.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,64 @@
+"""
+Medição da carga da staging_products com 1..N conexões (StagingParalelo),
+para escolher PRODUTOS_PARALELISMO / DB_POOL_SIZE no servidor de verdade:
+
+    DB_POOL_SIZE=9 python -m wsh.cadastro.benchmark_staging 1000000 1 2 4
+
+Gera N produtos sintéticos, carrega cada rodada com um lote_id próprio e
+apaga o lote no fim. Não toca na whsproducts.
+"""
+import sys
+import time
+import uuid
+import logging
+from connection.db_connection import engine
+from wsh.cadastro.products import (
+    ProdutoSchema, StagingParalelo, PRODUTOS_CHUNK, limpar_staging_produtos
+)
+
+logger = logging.getLogger("benchmark_staging")
+
+
+def gerar_produtos(total: int):
+    """Blocos de PRODUTOS_CHUNK produtos sintéticos (sem guardar tudo em memória)."""
+    for inicio in range(0, total, PRODUTOS_CHUNK):
+        yield [
+            ProdutoSchema(
+                PN=f"BENCH-{i:09d}",
+                Description=f"Produto de teste {i}",
+                Position=f"P{i % 5000:05d}",
+                PositionAux="",
+                SiCcode=f"S{i % 97:03d}"
+            )
+            for i in range(inicio, min(inicio + PRODUTOS_CHUNK, total))
+        ]
+
+
+def medir(total: int, conexoes: int) -> float:
+    """Linhas por segundo gravadas na staging com `conexoes` conexões."""
+    lote = str(uuid.uuid4())
+    carregador = StagingParalelo(lote, conexoes)
+    inicio = time.perf_counter()
+    try:
+        for bloco in gerar_produtos(total):
+            carregador.adicionar(bloco)
+        carregador.finalizar()
+        return carregador.linhas / (time.perf_counter() - inicio)
+    finally:
+        conn = engine.raw_connection()
+        try:
+            limpar_staging_produtos(conn, conn.cursor(), lote)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    niveis = [int(n) for n in sys.argv[2:]] or [1, 2, 4]
+
+    base = None
+    for conexoes in niveis:
+        vazao = medir(total, conexoes)
+        base = base or vazao
+        logger.info(f"{total} linhas, {conexoes} conexão(ões): {vazao:,.0f} linhas/s ({vazao / base:.2f}x)")
@@ -1,11 +1,25 @@
+import os
+import uuid
 import logging
-from fastapi import Depends, APIRouter, HTTPException
-from pydantic import BaseModel
+import tempfile
+import threading
+import pymysql
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED, FIRST_COMPLETED
+from fastapi import Depends, APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime
-from connection.db_connection import SessionLocal
+from connection.db_connection import SessionLocal, DB_LOCAL_INFILE, engine
+from connection.schema import (
+    expressao_hash_produto, expressao_balde_produto, expressao_hash_balde, BALDE_VAZIO
+)
+from wsh.jobs.jobs import submeter_job, Progresso, JOBS_MAX_WORKERS
+from wsh.api.json_stream import itens_json, lotes_validados
+from wsh.consulta.catalogo import invalidar_catalogo
+from wsh.movimento.romaneio import limpar_lotes_antigos
 
 products_rp = APIRouter()
 logging.basicConfig(level=logging.INFO)
@@ -38,158 +52,589 @@ def get_db():
 # Rota principal (staging + bulk merge)
 # ----------------------------
 @products_rp.post("/products", status_code=200)
-def receber_produtos(request: ProdutosRequest, db: Session = Depends(get_db)):
-    produtos = request.produtos
-    total = len(produtos)
-    logger.info(f"Recebendo {total} produtos (bulk staging + estatísticas + UPDATE/INSERT)")
+def receber_produtos(request: ProdutosRequest, background: bool = False, db: Session = Depends(get_db)):
+    if background:
+        job_id = submeter_job("/products", processar_produtos, request.produtos)
+        return {"status": "queued", "job_id": job_id}
+
+    return processar_produtos(db, Progresso(), request.produtos)
+
+
+PRODUTOS_CHUNK = 5000
+# conexões gravando a staging ao mesmo tempo (1 = desligado). Limitado pela
+# parte do pool que cabe a cada job: (DB_POOL_SIZE - 1 da própria
+# requisição) // JOBS_MAX_WORKERS. Para 4 conexões com os 2 workers de job
+# padrão: PRODUTOS_PARALELISMO=4 e DB_POOL_SIZE=9 (1 + 4 * 2).
+# Medição: python -m wsh.cadastro.benchmark_staging
+PRODUTOS_PARALELISMO = int(os.getenv("PRODUTOS_PARALELISMO", "1"))
+
+INSERT_STAGING_PRODUTOS_SQL = """
+    INSERT INTO staging_products (lote_id, PN, Description, Position, PositionAux, SiCcode)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def novo_lote(progresso: Progresso) -> str:
+    """Id das linhas desta importação na staging (o do job, quando houver)."""
+    return progresso.job_id or str(uuid.uuid4())
+
+
+def inserir_staging_produtos(cursor, produtos, lote: str) -> int:
+    """Insere um bloco de produtos na staging (PN vazio é descartado)."""
+    linhas = [
+        (lote, item.PN, item.Description, item.Position, item.PositionAux, item.SiCcode)
+        for item in produtos
+        if item.PN and item.PN.strip()
+    ]
+    if linhas:
+        cursor.executemany(INSERT_STAGING_PRODUTOS_SQL, linhas)
+    return len(linhas)
+
+
+# ----------------------------
+# Carga da staging: executemany ou LOAD DATA LOCAL INFILE
+# ----------------------------
+# erros do MySQL/PyMySQL quando o LOCAL INFILE está desligado no servidor/cliente
+ERROS_LOCAL_INFILE = {1148, 2068, 3948}
+_load_data_recusado = False
+
+LOAD_DATA_PRODUTOS_SQL = """
+    LOAD DATA LOCAL INFILE %s
+    INTO TABLE staging_products
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+    LINES TERMINATED BY '\\n'
+    (lote_id, PN, Description, Position, PositionAux, SiCcode)
+"""
+
+_ESCAPE_TSV = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+_UNESCAPE_TSV = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r", "0": "\0"}
+
+
+def _campo_tsv(valor: str) -> str:
+    return valor.translate(_ESCAPE_TSV)
+
+
+def _ler_campo_tsv(valor: str) -> str:
+    partes = []
+    i = 0
+    while i < len(valor):
+        c = valor[i]
+        if c == "\\" and i + 1 < len(valor):
+            partes.append(_UNESCAPE_TSV.get(valor[i + 1], valor[i + 1]))
+            i += 2
+        else:
+            partes.append(c)
+            i += 1
+    return "".join(partes)
+
+
+class CarregadorStaging:
+    """
+    Grava os blocos de produtos na staging_products.
+
+    Com DB_LOCAL_INFILE=1 (e local_infile ligado no servidor) os blocos vão
+    para um TSV temporário, carregado de uma vez com LOAD DATA LOCAL INFILE
+    em finalizar(). Se o servidor recusar, o TSV é relido e gravado pelo
+    executemany em blocos de PRODUTOS_CHUNK, como no caminho normal.
+    """
+
+    def __init__(self, cursor, lote: str):
+        self.cursor = cursor
+        self.lote = lote
+        self.arquivo = None
+        self.linhas = 0
+        self.metodo = "executemany"
+
+        if DB_LOCAL_INFILE and not _load_data_recusado and self._servidor_aceita():
+            self.arquivo = tempfile.NamedTemporaryFile(
+                mode="w", encoding="utf-8", newline="\n", suffix=".tsv", delete=False
+            )
+            self.metodo = "load_data"
+
+    def _servidor_aceita(self) -> bool:
+        self.cursor.execute("SELECT @@GLOBAL.local_infile")
+        return bool(self.cursor.fetchone()[0])
+
+    def adicionar(self, produtos) -> int:
+        if self.arquivo is None:
+            inseridos = inserir_staging_produtos(self.cursor, produtos, self.lote)
+            self.linhas += inseridos
+            return inseridos
+
+        inseridos = 0
+        for item in produtos:
+            if item.PN and item.PN.strip():
+                campos = (self.lote, item.PN, item.Description, item.Position, item.PositionAux, item.SiCcode)
+                self.arquivo.write("\t".join(_campo_tsv(c) for c in campos) + "\n")
+                inseridos += 1
+
+        self.linhas += inseridos
+        return inseridos
+
+    def finalizar(self):
+        if self.arquivo is None:
+            return
+
+        global _load_data_recusado
+        self.arquivo.close()
+
+        try:
+            self.cursor.execute(LOAD_DATA_PRODUTOS_SQL, (self.arquivo.name,))
+            logger.info(f"  LOAD DATA LOCAL INFILE: {self.cursor.rowcount} linhas na staging")
+
+        except pymysql.err.MySQLError as e:
+            if not e.args or e.args[0] not in ERROS_LOCAL_INFILE:
+                raise
+
+            # não tenta de novo até reiniciar a API
+            _load_data_recusado = True
+            self.metodo = "executemany"
+            logger.warning(f"  LOAD DATA LOCAL INFILE recusado ({e}), usando executemany")
+            self._regravar_executemany()
+
+        finally:
+            self.descartar()
+
+    def _regravar_executemany(self):
+        bloco = []
+        with open(self.arquivo.name, encoding="utf-8", newline="\n") as f:
+            for linha in f:
+                bloco.append(tuple(_ler_campo_tsv(c) for c in linha.rstrip("\n").split("\t")))
+                if len(bloco) >= PRODUTOS_CHUNK:
+                    self.cursor.executemany(INSERT_STAGING_PRODUTOS_SQL, bloco)
+                    bloco = []
+        if bloco:
+            self.cursor.executemany(INSERT_STAGING_PRODUTOS_SQL, bloco)
+
+    def descartar(self):
+        if self.arquivo is None:
+            return
+        try:
+            self.arquivo.close()
+            os.remove(self.arquivo.name)
+        except OSError:
+            pass
 
-    CHUNK_SIZE = 5000
 
+# ----------------------------
+# Carga da staging em paralelo (várias conexões)
+# ----------------------------
+def paralelismo_staging() -> int:
     try:
-        conn = db.connection().connection
+        tamanho_pool = engine.pool.size()
+    except AttributeError:
+        return 1
+    # a conexão da própria requisição já saiu do pool; o resto é dividido
+    # entre as importações que podem rodar juntas
+    limite = (tamanho_pool - 1) // max(1, JOBS_MAX_WORKERS)
+    return max(1, min(PRODUTOS_PARALELISMO, limite))
+
+
+class StagingParalelo:
+    """
+    Mesma interface do CarregadorStaging, mas cada bloco vai para uma de N
+    threads, cada uma com a sua conexão do pool e commit por bloco. Todas
+    gravam o mesmo lote_id, em blocos disjuntos.
+
+    finalizar() é a barreira: espera todos os blocos (e repassa o primeiro
+    erro) antes do merge. No máximo 2*N blocos ficam na fila, então a rota
+    em streaming não acumula o corpo em memória.
+    """
+
+    def __init__(self, lote: str, conexoes: int):
+        self.lote = lote
+        self.conexoes = conexoes
+        self.linhas = 0
+        self.metodo = f"executemany_paralelo_{conexoes}"
+        self.executor = ThreadPoolExecutor(max_workers=conexoes, thread_name_prefix="staging")
+        self.pendentes = set()
+        self._local = threading.local()
+        self._abertas = []
+        self._lock = threading.Lock()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = engine.raw_connection()
+            self._local.conn = conn
+            with self._lock:
+                self._abertas.append(conn)
+        return conn
+
+    def _gravar(self, linhas):
+        conn = self._conexao()
         cursor = conn.cursor()
+        try:
+            cursor.executemany(INSERT_STAGING_PRODUTOS_SQL, linhas)
+            conn.commit()
+        finally:
+            cursor.close()
 
-        # 1) Inserir todos na staging
-        insert_staging_sql = """
-            INSERT INTO staging_products (PN, Description, Position, PositionAux, SiCcode)
-            VALUES (%s, %s, %s, %s, %s)
-        """
-        staging_rows = [
-            (item.PN, item.Description, item.Position, item.PositionAux, item.SiCcode)
+    def _esperar(self, todos: bool):
+        feitos, self.pendentes = wait(self.pendentes, return_when=ALL_COMPLETED if todos else FIRST_COMPLETED)
+        for futuro in feitos:
+            futuro.result()
+
+    def adicionar(self, produtos) -> int:
+        linhas = [
+            (self.lote, item.PN, item.Description, item.Position, item.PositionAux, item.SiCcode)
             for item in produtos
             if item.PN and item.PN.strip()
         ]
+        if not linhas:
+            return 0
+
+        while len(self.pendentes) >= 2 * self.conexoes:
+            self._esperar(todos=False)
+
+        self.pendentes.add(self.executor.submit(self._gravar, linhas))
+        self.linhas += len(linhas)
+        return len(linhas)
 
-        pos = 0
-        total_staging = len(staging_rows)
-        while pos < total_staging:
-            chunk = staging_rows[pos: pos + CHUNK_SIZE]
-            cursor.executemany(insert_staging_sql, chunk)
-            pos += CHUNK_SIZE
-            logger.info(f"  Inseridos na staging: {min(pos, total_staging)}/{total_staging}")
+    def finalizar(self):
+        try:
+            self._esperar(todos=True)
+        finally:
+            self.descartar()
+
+    def descartar(self):
+        for futuro in self.pendentes:
+            futuro.cancel()
+        self.executor.shutdown(wait=True)
+        self.pendentes = set()
+
+        with self._lock:
+            abertas, self._abertas = self._abertas, []
+        for conn in abertas:
+            try:
+                conn.rollback()
+                conn.close()  # devolve ao pool
+            except Exception:
+                pass
+
+
+def novo_carregador(cursor, lote: str):
+    """LOAD DATA quando disponível; senão executemany, em paralelo se configurado."""
+    carregador = CarregadorStaging(cursor, lote)
+    if carregador.metodo == "executemany":
+        conexoes = paralelismo_staging()
+        if conexoes > 1:
+            return StagingParalelo(lote, conexoes)
+    return carregador
+
+
+def abortar_staging_produtos(conn, cursor, lote: str, carregador=None):
+    """Para os gravadores (threads do StagingParalelo) antes de apagar o lote."""
+    if carregador is not None:
+        carregador.descartar()
+    limpar_staging_produtos(conn, cursor, lote)
+
+
+def limpar_staging_vencida(conn, cursor):
+    """Lotes esquecidos na staging (importação que caiu sem limpar)."""
+    limpar_lotes_antigos(cursor, "staging_products", "criado_em")
+    conn.commit()
+
+
+def limpar_staging_produtos(conn, cursor, lote: str):
+    """Remove só as linhas desta importação (índice por lote_id)."""
+    if conn is None:
+        return
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+    try:
+        cursor.execute("DELETE FROM staging_products WHERE lote_id = %s", (lote,))
         conn.commit()
+    except Exception:
+        pass
 
-        # 2) Criar staging única (deduplicação por PN)
-        cursor.execute("DROP TEMPORARY TABLE IF EXISTS staging_unique")
-        cursor.execute("""
-            CREATE TEMPORARY TABLE staging_unique AS
+
+def processar_produtos(db: Session, progresso: Progresso, produtos: List[ProdutoSchema]):
+    total = len(produtos)
+    logger.info(f"Recebendo {total} produtos (bulk staging + estatísticas + UPDATE/INSERT)")
+
+    lote = novo_lote(progresso)
+    conn = cursor = carregador = None
+    try:
+        conn = db.connection().connection
+        cursor = conn.cursor()
+        limpar_staging_vencida(conn, cursor)
+
+        # 1) Inserir todos na staging
+        progresso.fase("staging")
+        carregador = novo_carregador(cursor, lote)
+
+        for pos in range(0, total, PRODUTOS_CHUNK):
+            inseridos = carregador.adicionar(produtos[pos: pos + PRODUTOS_CHUNK])
+            progresso.avancar(inseridos)
+            logger.info(f"  Inseridos na staging: {min(pos + PRODUTOS_CHUNK, total)}/{total}")
+        carregador.finalizar()
+        conn.commit()
+
+        return mesclar_produtos(conn, cursor, progresso, total, lote, carregador.metodo)
+
+    except Exception as e:
+        logger.error(f"Erro durante processamento: {e}", exc_info=True)
+        abortar_staging_produtos(conn, cursor, lote, carregador)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------
+# Rota em streaming (corpo lido e gravado em blocos)
+# ----------------------------
+@products_rp.post("/products/stream", status_code=200)
+async def receber_produtos_stream(request: Request):
+    """
+    Mesmo contrato do /products ({"produtos": [...]}), mas o corpo é lido
+    aos poucos: cada produto é validado ao chegar e vai para a staging em
+    blocos de PRODUTOS_CHUNK. A memória fica limitada ao bloco atual.
+    """
+    progresso = Progresso(movlog=request.state.movlog)
+    lote = novo_lote(progresso)
+    db = SessionLocal()
+    conn = cursor = carregador = None
+
+    try:
+        conn = await run_in_threadpool(lambda: db.connection().connection)
+        cursor = conn.cursor()
+        await run_in_threadpool(limpar_staging_vencida, conn, cursor)
+
+        progresso.fase("staging")
+        carregador = await run_in_threadpool(novo_carregador, cursor, lote)
+        total = 0
+
+        itens = itens_json(request.stream(), "produtos")
+        async for bloco in lotes_validados(itens, ProdutoSchema, PRODUTOS_CHUNK):
+            total += len(bloco)
+            progresso.avancar(await run_in_threadpool(carregador.adicionar, bloco))
+            logger.info(f"  Inseridos na staging (stream): {total}")
+
+        await run_in_threadpool(carregador.finalizar)
+        await run_in_threadpool(conn.commit)
+        logger.info(f"Recebidos {total} produtos (stream)")
+
+        return await run_in_threadpool(
+            mesclar_produtos, conn, cursor, progresso, total, lote, carregador.metodo
+        )
+
+    except HTTPException:
+        await run_in_threadpool(abortar_staging_produtos, conn, cursor, lote, carregador)
+        raise
+
+    except Exception as e:
+        logger.error(f"Erro durante processamento: {e}", exc_info=True)
+        await run_in_threadpool(abortar_staging_produtos, conn, cursor, lote, carregador)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        # shutdown do executor/rollback/close bloqueiam: fora do event loop
+        if carregador is not None:
+            await run_in_threadpool(carregador.descartar)
+        await run_in_threadpool(db.close)
+
+
+def mesclar_produtos(conn, cursor, progresso: Progresso, total: int, lote: str, metodo: str = "executemany"):
+    """Passos 2 a 5: deduplica a staging do lote, calcula estatísticas e faz o merge."""
+    # 2) Criar staging única (deduplicação por PN) já com o hash do conteúdo
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS staging_unique")
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE staging_unique (PRIMARY KEY (PN)) AS
+        SELECT u.*, {expressao_hash_produto("u")} AS content_hash
+        FROM (
             SELECT PN,
                    MAX(Description)   AS Description,
                    MAX(Position)      AS Position,
                    MAX(PositionAux)   AS PositionAux,
                    MAX(SiCcode)       AS SiCcode
             FROM staging_products
+            WHERE lote_id = %s
             GROUP BY PN
-        """)
-        conn.commit()
+        ) u
+    """, (lote,))
+    conn.commit()
+
+    # 3) Estatísticas (uma passada, comparando só o hash)
+    progresso.fase("estatisticas")
+    logger.info("Calculando estatísticas...")
+
+    cursor.execute("""
+        SELECT
+            COALESCE(SUM(w.PN IS NULL), 0),
+            COALESCE(SUM(w.situationregistration <> 'E' AND w.content_hash <> s.content_hash), 0),
+            COALESCE(SUM(w.situationregistration <> 'E' AND w.content_hash = s.content_hash), 0)
+        FROM staging_unique s
+        LEFT JOIN whsproducts w ON w.PN = s.PN
+    """)
+    inseridos, atualizados, ignorados = (int(v) for v in cursor.fetchone())
+
+    # 4a) UPDATE — somente PNs existentes cujo conteúdo mudou
+    progresso.fase("merge")
+    logger.info("Atualizando produtos existentes...")
+    update_sql = """
+        UPDATE whsproducts w
+        JOIN staging_unique s ON s.PN = w.PN
+        SET
+            w.Description = s.Description,
+            w.Position = s.Position,
+            w.PositionAux = s.PositionAux,
+            w.SiCcode = s.SiCcode,
+            w.situationregistration = 'A',
+            w.dateregistration = NOW()
+        WHERE w.situationregistration <> 'E'
+          AND w.content_hash <> s.content_hash
+    """
+    cursor.execute(update_sql)
+    progresso.avancar(cursor.rowcount)
+    conn.commit()
+
+    # 4b) INSERT — somente PNs inexistentes
+    logger.info("Inserindo novos produtos...")
+    insert_sql = """
+        INSERT INTO whsproducts
+            (PN, Description, Position, PositionAux, SiCcode, situationregistration, dateregistration)
+        SELECT
+            s.PN,
+            s.Description,
+            s.Position,
+            s.PositionAux,
+            s.SiCcode,
+            'I',
+            NOW()
+        FROM staging_unique s
+        LEFT JOIN whsproducts w ON w.PN = s.PN
+        WHERE w.PN IS NULL
+    """
+    cursor.execute(insert_sql)
+    progresso.avancar(cursor.rowcount)
+    conn.commit()
+
+    # 5) Limpar staging (só as linhas deste lote)
+    cursor.execute("DELETE FROM staging_products WHERE lote_id = %s", (lote,))
+    conn.commit()
+
+    # catálogo em memória busca as alterações na próxima consulta
+    if inseridos or atualizados:
+        invalidar_catalogo()
+
+    result = {
+        "status": "success",
+        "total_recebido": total,
+        "inseridos": inseridos,
+        "atualizados": atualizados,
+        "ignorados": ignorados,
+        "staging_metodo": metodo,
+        "fases": progresso.resumo_fases()
+    }
+
+    progresso.movlog["inserts"] = inseridos
+    progresso.movlog["updates"] = atualizados
+    progresso.movlog["total"] = total
+
+    logger.info(f"Processamento concluído: {result}")
+    return result
 
-        # 3) Estatísticas
-        logger.info("Calculando estatísticas...")
 
-        inserts_sql = """
-            SELECT COUNT(*)
-            FROM staging_unique s
-            LEFT JOIN whsproducts w ON w.PN = s.PN
-            WHERE w.PN IS NULL
-        """
-
-        updates_sql = """
-            SELECT COUNT(*)
-            FROM staging_unique s
-            JOIN whsproducts w ON w.PN = s.PN
-            WHERE w.situationregistration <> 'E'
-              AND (
-                    COALESCE(TRIM(UPPER(w.Description)),'') <> COALESCE(TRIM(UPPER(s.Description)),'') OR
-                    COALESCE(TRIM(UPPER(w.Position)),'') <> COALESCE(TRIM(UPPER(s.Position)),'') OR
-                    COALESCE(TRIM(UPPER(w.PositionAux)),'') <> COALESCE(TRIM(UPPER(s.PositionAux)),'') OR
-                    COALESCE(TRIM(UPPER(w.SiCcode)),'') <> COALESCE(TRIM(UPPER(s.SiCcode)),''))
-        """
-
-        ignorados_sql = """
-            SELECT COUNT(*)
-            FROM staging_unique s
-            JOIN whsproducts w ON w.PN = s.PN
-            WHERE w.situationregistration <> 'E'
-              AND (
-                    COALESCE(TRIM(UPPER(w.Description)),'') = COALESCE(TRIM(UPPER(s.Description)),'') AND
-                    COALESCE(TRIM(UPPER(w.Position)),'') = COALESCE(TRIM(UPPER(s.Position)),'') AND
-                    COALESCE(TRIM(UPPER(w.PositionAux)),'') = COALESCE(TRIM(UPPER(s.PositionAux)),'') AND
-                    COALESCE(TRIM(UPPER(w.SiCcode)),'') = COALESCE(TRIM(UPPER(s.SiCcode)),''))
-        """
-
-        cursor.execute(inserts_sql)
-        inseridos = cursor.fetchone()[0]
-
-        cursor.execute(updates_sql)
-        atualizados = cursor.fetchone()[0]
-
-        cursor.execute(ignorados_sql)
-        ignorados = cursor.fetchone()[0]
-
-        # 4a) UPDATE — somente PNs existentes
-        logger.info("Atualizando produtos existentes...")
-        update_sql = """
-            UPDATE whsproducts w
-            JOIN staging_unique s ON s.PN = w.PN
-            SET
-                w.Description = s.Description,
-                w.Position = s.Position,
-                w.PositionAux = s.PositionAux,
-                w.SiCcode = s.SiCcode,
-                w.situationregistration = 'A',
-                w.dateregistration = NOW()
-            WHERE w.situationregistration <> 'E'
-        """
-        cursor.execute(update_sql)
-        conn.commit()
+# ----------------------------
+# Sincronização delta do catálogo
+# ----------------------------
+# O cliente calcula o hash de cada produto (connection.schema.hash_produto)
+# e, antes de mandar o catálogo inteiro para /products:
+#   1) /products/delta/buckets -> manda o hash de cada balde e recebe os
+#      baldes que divergem do servidor;
+#   2) /products/delta -> manda (PN, hash) só desses baldes e recebe os PNs
+#      que faltam ou estão diferentes no servidor;
+#   3) /products -> envia só esses produtos.
+class ProdutoHash(BaseModel):
+    PN: str
+    hash: str
+
+class DeltaRequest(BaseModel):
+    itens: List[ProdutoHash]
+
+class DeltaBucketsRequest(BaseModel):
+    buckets: int = Field(gt=0, le=65536)
+    hashes: List[str]  # posição = número do balde
+
+
+@products_rp.post("/products/delta/buckets")
+def delta_buckets(request: DeltaBucketsRequest, db: Session = Depends(get_db)):
+    if len(request.hashes) != request.buckets:
+        raise HTTPException(status_code=400, detail="hashes deve ter um valor por balde")
+
+    # mesma regra do merge e do /products/delta: só linhas ativas, uma por
+    # PN (a de maior id). Linha 'E' ou PN duplicado (que no BIT_XOR se
+    # anula) deixaria o balde sempre divergente do cliente.
+    sql = f"""
+        SELECT {expressao_balde_produto(request.buckets, "w")} AS balde,
+               {expressao_hash_balde("w")} AS hash_balde
+        FROM whsproducts w
+        JOIN (
+            SELECT MAX(id) AS id
+            FROM whsproducts
+            WHERE situationregistration <> 'E'
+            GROUP BY PN
+        ) ativo ON ativo.id = w.id
+        GROUP BY balde
+    """
+    servidor = {
+        int(balde): hash_balde
+        for balde, hash_balde in db.execute(text(sql))
+    }
 
-        # 4b) INSERT — somente PNs inexistentes
-        logger.info("Inserindo novos produtos...")
-        insert_sql = """
-            INSERT INTO whsproducts
-                (PN, Description, Position, PositionAux, SiCcode, situationregistration, dateregistration)
-            SELECT
-                s.PN,
-                s.Description,
-                s.Position,
-                s.PositionAux,
-                s.SiCcode,
-                'I',
-                NOW()
-            FROM staging_unique s
-            LEFT JOIN whsproducts w ON w.PN = s.PN
-            WHERE w.PN IS NULL
-        """
-        cursor.execute(insert_sql)
-        conn.commit()
+    divergentes = [
+        balde for balde, hash_cliente in enumerate(request.hashes)
+        if hash_cliente.lower() != servidor.get(balde, BALDE_VAZIO)
+    ]
 
-        # 5) Limpar staging
-        cursor.execute("TRUNCATE TABLE staging_products")
-        conn.commit()
+    return {"status": "ok", "buckets": request.buckets, "divergentes": divergentes}
 
-        result = {
-            "status": "success",
-            "total_recebido": total,
-            "inseridos": inseridos,
-            "atualizados": atualizados,
-            "ignorados": ignorados
-        }
 
-        logger.info(f"Processamento concluído: {result}")
-        return result
+@products_rp.post("/products/delta")
+def delta_produtos(request: DeltaRequest, db: Session = Depends(get_db)):
+    linhas = [(item.PN, item.hash.lower()) for item in request.itens if item.PN.strip()]
 
-    except Exception as e:
-        logger.error(f"Erro durante processamento: {e}", exc_info=True)
-        try:
-            conn.rollback()
-        except Exception:
-            pass
-        try:
-            cursor.execute("TRUNCATE TABLE staging_products")
-            conn.commit()
-        except Exception:
-            pass
-        raise HTTPException(status_code=500, detail=str(e))
+    conn = db.connection().connection
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_delta_produtos")
+        cursor.execute("""
+            CREATE TEMPORARY TABLE tmp_delta_produtos (
+                PN VARCHAR(255) NOT NULL PRIMARY KEY,
+                content_hash CHAR(32) NOT NULL
+            )
+        """)
+
+        for inicio in range(0, len(linhas), PRODUTOS_CHUNK):
+            cursor.executemany(
+                "INSERT IGNORE INTO tmp_delta_produtos (PN, content_hash) VALUES (%s, %s)",
+                linhas[inicio:inicio + PRODUTOS_CHUNK]
+            )
+
+        # mesma regra do merge: PN com situationregistration = 'E' nunca é
+        # atualizado, então não adianta pedir para reenviar
+        cursor.execute("""
+            SELECT DISTINCT d.PN
+            FROM tmp_delta_produtos d
+            LEFT JOIN whsproducts w ON w.PN = d.PN
+            WHERE w.PN IS NULL
+               OR (w.situationregistration <> 'E' AND w.content_hash <> d.content_hash)
+        """)
+        pendentes = [linha[0] for linha in cursor.fetchall()]
+
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_delta_produtos")
+    finally:
+        cursor.close()
+
+    return {
+        "status": "ok",
+        "total_recebido": len(linhas),
+        "total_pendentes": len(pendentes),
+        "pendentes": pendentes
+    }
 
 
 @products_rp.post("/update_positions")
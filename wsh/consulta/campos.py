@@ -0,0 +1,98 @@
+import threading
+from fastapi import HTTPException
+from sqlalchemy import text
+
+# ------------------------------------------------------
+# PROJEÇÃO DE COLUNAS (?fields=)
+# ------------------------------------------------------
+# Só as colunas listadas em CAMPOS_PERMITIDOS podem ser pedidas (senha,
+# token etc. ficam de fora). A lista é cruzada com o information_schema,
+# lido uma vez por processo, para não gerar SELECT de coluna inexistente.
+_COLUNAS_PUTAWAY = (
+    "Id", "User_Id", "PN", "Description", "Position", "siccode",
+    "Qty", "RevisedQty", "StandardQty", "LPSQty", "UndeclaredSQty", "breakdownQty",
+    "RevisedVolume", "releasedQty", "Reference", "Waybill", "operator_id",
+    "processlines", "inputtype", "datecreate", "DateProcessStart", "DateProcessEnd",
+    "Print", "typeprint", "printqty", "AAF", "dateatualizeaaf", "grn1", "grn", "GRN3",
+    "RNC", "processdate", "Criticality", "situationregistration", "dateregistration",
+)
+
+CAMPOS_PERMITIDOS = {
+    "caduser": ("id", "users", "usertype", "situationregistration", "dateregistration"),
+    "whsproductsputaway": _COLUNAS_PUTAWAY,
+    "whsproductsputawaylog": _COLUNAS_PUTAWAY + ("Id_whsprod", "qrcode"),
+    "whsmovementputaway": (
+        "id", "idlog", "user_id", "pn", "position", "standardposition", "reference",
+        "datecreate", "cont", "status", "confirm", "dateregistration", "synchronize",
+    ),
+}
+
+_colunas = {}
+_lock = threading.Lock()
+
+
+def colunas_tabela(db, tabela: str) -> dict:
+    """{nome em minúsculas: nome real} das colunas permitidas que existem na tabela."""
+    with _lock:
+        if tabela in _colunas:
+            return _colunas[tabela]
+
+    rows = db.execute(text("""
+        SELECT COLUMN_NAME
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :tabela
+          AND EXTRA NOT LIKE '%INVISIBLE%'
+        ORDER BY ORDINAL_POSITION
+    """), {"tabela": tabela}).fetchall()
+
+    permitidas = {c.lower() for c in CAMPOS_PERMITIDOS.get(tabela, ())}
+    colunas = {r[0].lower(): r[0] for r in rows if r[0].lower() in permitidas}
+
+    with _lock:
+        _colunas[tabela] = colunas
+    return colunas
+
+
+def ler_fields(fields: str) -> list:
+    """'PN, Qty,,Position' -> ['PN', 'Qty', 'Position'] (sem repetidos)."""
+    nomes = []
+    for nome in (fields or "").split(","):
+        nome = nome.strip()
+        if nome and nome.lower() not in (n.lower() for n in nomes):
+            nomes.append(nome)
+    return nomes
+
+
+def projecao(db, tabela: str, fields: str, alias: str = "", extras: dict = None, obrigatorios=()) -> str:
+    """
+    Monta a lista do SELECT para ?fields=.
+
+    Sem fields devolve o SELECT * de sempre. Cada campo é validado contra as
+    colunas permitidas da tabela (sem diferenciar maiúsculas) ou contra `extras`
+    ({nome: expressão}, para colunas de JOIN); campo desconhecido -> 400.
+    `obrigatorios` entram no SELECT mesmo sem terem sido pedidos (ex.: chave
+    do cursor de paginação).
+    """
+    prefixo = f"{alias}." if alias else ""
+    extras = {k.lower(): (k, v) for k, v in (extras or {}).items()}
+    pedidos = ler_fields(fields)
+
+    if not pedidos:
+        return ", ".join([f"{prefixo}*"] + [f"{v} AS {k}" for k, v in extras.values()])
+
+    colunas = colunas_tabela(db, tabela)
+    invalidos = [n for n in pedidos if n.lower() not in colunas and n.lower() not in extras]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos para {tabela}: {', '.join(invalidos)}")
+
+    selecionados = []
+    for nome in pedidos + [o for o in obrigatorios if o.lower() not in (p.lower() for p in pedidos)]:
+        chave = nome.lower()
+        if chave in colunas:
+            selecionados.append(f"{prefixo}`{colunas[chave]}`")
+        elif chave in extras:
+            real, expressao = extras[chave]
+            selecionados.append(f"{expressao} AS {real}")
+
+    return ", ".join(selecionados)
@@ -0,0 +1,243 @@
+import os
+import sys
+import time
+import logging
+import threading
+import pymysql
+from connection.db_connection import engine
+
+logger = logging.getLogger("catalogo")
+
+# ------------------------------------------------------
+# CATÁLOGO DE PRODUTOS EM MEMÓRIA
+# ------------------------------------------------------
+# Cópia de whsproducts (PN -> Description, Position, PositionAux, SiCcode)
+# em listas paralelas, com as strings internadas (posições e siccodes se
+# repetem muito). Carregada no primeiro uso; depois só lê as linhas com
+# dateregistration acima da última marca vista. O merge do /products chama
+# invalidar_catalogo() para a próxima consulta já buscar as alterações.
+#
+# Cada processo (worker do uvicorn) tem a sua cópia, e a invalidação só
+# vale para o worker que fez o merge: os outros podem ficar até
+# CATALOGO_REFRESH_SEGUNDOS atrasados. Por isso o catálogo só serve leituras
+# (/consulta/item); gravações continuam usando a whsproducts.
+#
+# Só a primeira carga roda dentro da requisição. Depois disso a atualização
+# (índice idx_whsproducts_dateregistration) roda numa thread com conexão
+# própria e a consulta segue respondendo com a cópia atual.
+#
+# DELETE físico na whsproducts não aparece na leitura incremental (a linha
+# some, não há dateregistration novo): o PN apagado só sai na recarga
+# completa, feita em segundo plano a cada CATALOGO_RECARGA_SEGUNDOS.
+CATALOGO_REFRESH_SEGUNDOS = int(os.getenv("CATALOGO_REFRESH_SEGUNDOS", "60"))
+CATALOGO_RECARGA_SEGUNDOS = int(os.getenv("CATALOGO_RECARGA_SEGUNDOS", "3600"))
+# relê um pouco antes da marca: transação que gravou NOW() antes e fez
+# commit depois de outra não fica de fora
+CATALOGO_MARGEM_SEGUNDOS = int(os.getenv("CATALOGO_MARGEM_SEGUNDOS", "300"))
+
+_SELECT_CATALOGO = """
+    SELECT id, PN, Description, Position, PositionAux, SiCcode,
+           situationregistration, dateregistration
+    FROM whsproducts
+"""
+
+
+def chave_pn(pn: str) -> str:
+    # como a comparação do MySQL: sem diferença de maiúsculas nem espaços à direita
+    return pn.rstrip(" ").upper()
+
+
+def _internar(valor):
+    return sys.intern(valor) if type(valor) is str else valor
+
+
+class _Registros:
+    """Listas paralelas + índice; trocadas inteiras numa recarga."""
+
+    def __init__(self):
+        self.indice = {}        # chave do PN -> posição nas listas
+        self.ids = []
+        self.descricoes = []
+        self.posicoes = []
+        self.posicoes_aux = []
+        self.siccodes = []
+
+    def aplicar(self, linha, reler: set = None) -> bool:
+        """
+        Vale a linha de maior id que não esteja excluída, como no
+        SELECT ... ORDER BY id DESC da consulta. A linha nova entra no fim
+        das listas e só então o índice aponta para ela: quem lê sem lock
+        nunca vê um registro pela metade.
+
+        Linha 'E' só importa se for a própria linha que está valendo (foi
+        excluída depois): o PN sai do índice e vai para `reler`, para buscar
+        no banco a próxima linha ativa de menor id, se houver.
+        """
+        id_, pn, descricao, posicao, posicao_aux, siccode, situacao = linha
+        if not pn:
+            return False
+
+        chave = chave_pn(pn)
+        atual = self.indice.get(chave)
+
+        if situacao == "E":
+            if atual is not None and self.ids[atual] == id_:
+                del self.indice[chave]
+                if reler is not None:
+                    reler.add(pn)
+                return True
+            return False
+
+        if atual is not None:
+            if self.ids[atual] > id_:
+                return False
+            if (self.descricoes[atual], self.posicoes[atual], self.posicoes_aux[atual], self.siccodes[atual]) \
+                    == (descricao, posicao, posicao_aux, siccode):
+                self.ids[atual] = id_
+                return False
+
+        self.ids.append(id_)
+        self.descricoes.append(_internar(descricao))
+        self.posicoes.append(_internar(posicao))
+        self.posicoes_aux.append(_internar(posicao_aux))
+        self.siccodes.append(_internar(siccode))
+        self.indice[chave] = len(self.ids) - 1
+        return True
+
+
+class CatalogoProdutos:
+    def __init__(self):
+        self.registros = None   # None = ainda não carregado
+        self.marca = None       # maior dateregistration lido
+        self.atualizado_em = 0.0
+        self.carregado_em = 0.0
+        self.invalidado = False
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Leitura
+    # ----------------------------
+    def buscar(self, conn, pn: str):
+        """(Description, Position, PositionAux, SiCcode) do PN, ou None."""
+        self.garantir(conn)
+        r = self.registros
+        i = r.indice.get(chave_pn(pn))
+        if i is None:
+            return None
+        return r.descricoes[i], r.posicoes[i], r.posicoes_aux[i], r.siccodes[i]
+
+    def garantir(self, conn):
+        if self.registros is None:
+            with self._lock:
+                if self.registros is None:
+                    self._carregar(conn)
+            return
+
+        if self.invalidado or time.monotonic() - self.atualizado_em > CATALOGO_REFRESH_SEGUNDOS:
+            # quem chegar durante a atualização usa a cópia atual
+            if self._lock.acquire(blocking=False):
+                try:
+                    threading.Thread(target=self._atualizar_em_segundo_plano, name="catalogo", daemon=True).start()
+                except Exception:
+                    self._lock.release()
+                    raise
+
+    def invalidar(self):
+        self.invalidado = True
+
+    def _atualizar_em_segundo_plano(self):
+        """Roda com o _lock já adquirido por garantir(); libera ao terminar."""
+        try:
+            conn = engine.raw_connection()
+            try:
+                if time.monotonic() - self.carregado_em > CATALOGO_RECARGA_SEGUNDOS:
+                    self._carregar(conn)
+                else:
+                    self._atualizar(conn)
+            finally:
+                conn.close()
+        except Exception:
+            logger.exception("Erro ao atualizar o catálogo (mantida a cópia atual)")
+        finally:
+            self._lock.release()
+
+    # ----------------------------
+    # Carga / atualização
+    # ----------------------------
+    def _ler(self, cursor, registros: _Registros, reler: set = None) -> int:
+        alterados = 0
+        for *linha, data in cursor:
+            if data is not None and (self.marca is None or data > self.marca):
+                self.marca = data
+            alterados += registros.aplicar(linha, reler)
+        return alterados
+
+    def _carregar(self, conn):
+        inicio = time.monotonic()
+        self.invalidado = False
+        self.marca = None
+        registros = _Registros()
+
+        # cursor sem buffer: as linhas vão direto para as listas
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(_SELECT_CATALOGO + " ORDER BY id")
+            self._ler(cursor, registros)
+        finally:
+            cursor.close()
+
+        self.registros = registros
+        self.atualizado_em = self.carregado_em = time.monotonic()
+        logger.info(f"Catálogo carregado: {len(registros.indice)} PNs em {time.monotonic() - inicio:.2f}s")
+
+    def _atualizar(self, conn):
+        self.invalidado = False
+        registros = self.registros
+
+        cursor = conn.cursor()
+        try:
+            if self.marca is None:
+                cursor.execute(_SELECT_CATALOGO + " ORDER BY id")
+            else:
+                cursor.execute(
+                    _SELECT_CATALOGO + """
+                    WHERE dateregistration >= %s - INTERVAL %s SECOND
+                    ORDER BY id
+                    """,
+                    (self.marca, CATALOGO_MARGEM_SEGUNDOS)
+                )
+            reler = set()
+            alterados = self._ler(cursor, registros, reler)
+
+            # PNs cuja linha ativa foi excluída: a anterior (se houver) volta a valer
+            for pn in reler:
+                cursor.execute(
+                    _SELECT_CATALOGO + """
+                    WHERE PN = %s AND situationregistration <> 'E'
+                    ORDER BY id DESC
+                    LIMIT 1
+                    """,
+                    (pn,)
+                )
+                self._ler(cursor, registros)
+        finally:
+            cursor.close()
+
+        self.atualizado_em = time.monotonic()
+
+        # cada alteração ocupa uma posição nova; muito espaço perdido -> recarrega
+        if len(registros.ids) > 2 * len(registros.indice) + 10000:
+            self._carregar(conn)
+        elif alterados:
+            logger.info(f"Catálogo atualizado: {alterados} PNs")
+
+
+catalogo = CatalogoProdutos()
+
+
+def buscar_produto(conn, pn: str):
+    return catalogo.buscar(conn, pn)
+
+
+def invalidar_catalogo():
+    catalogo.invalidar()
@@ -4,6 +4,7 @@ from typing import Optional
 import logging
 from connection.db_connection import Base, engine, SessionLocal
 from pydantic import BaseModel
+from wsh.consulta.catalogo import buscar_produto
 
 consults_rp = APIRouter()
 
@@ -57,20 +58,13 @@ def consulta_item(
                 "breakdownqty": row[10],
             }
 
-        # Consulta whsproducts
-        sql_products = f"""
-            SELECT Description, Position, siccode
-            FROM whsproducts
-            WHERE PN = '{pn}' AND situationregistration <> 'E'
-            order by id desc 
-        """
-        cursor.execute(sql_products)
-        row = cursor.fetchone()
-        if row:
+        # Consulta whsproducts (catálogo em memória)
+        produto = buscar_produto(conn, pn)
+        if produto:
             resultado["products"] = {
-                "description": row[0],
-                "position": row[1],
-                "siccode": row[2],
+                "description": produto[0],
+                "position": produto[1],
+                "siccode": produto[3],
             }
 
         # Consulta totais no log
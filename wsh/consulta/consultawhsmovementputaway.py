@@ -1,17 +1,18 @@
 from typing import Optional
 from fastapi import FastAPI, Depends, HTTPException, APIRouter
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy import text
 import traceback
 from datetime import datetime
 from connection.db_connection import Base, engine, SessionLocal
+from wsh.consulta.campos import projecao
+from wsh.api.resposta import ORJSONResposta
 
 consult_mov_putaway = APIRouter()
 
 
 
-@consult_mov_putaway.get("/consultmovputaway")
-@consult_mov_putaway.get("/consultmovputaway/{pn}")
+@consult_mov_putaway.get("/consultmovputaway", response_class=ORJSONResposta)
+@consult_mov_putaway.get("/consultmovputaway/{pn}", response_class=ORJSONResposta)
 def movement_putaway(
     pn: Optional[str] = None,
     user_id: Optional[int] = None,
@@ -21,11 +22,14 @@ def movement_putaway(
     position: Optional[str] = None,
     reference: Optional[str] = None,
     confirm: Optional[str] = None,
+    fields: str = "",
 ):
     db = SessionLocal()
     try:
-        base_sql = """
-            SELECT A.*, B.users
+        campos = projecao(db, "whsmovementputaway", fields, alias="A", extras={"users": "B.users"})
+
+        base_sql = f"""
+            SELECT {campos}
             FROM whsmovementputaway A
             LEFT JOIN caduser B ON B.id = A.user_id
              WHERE 1=1
@@ -67,13 +71,16 @@ def movement_putaway(
             params["date_to"] = date_to
 
         result = db.execute(text(base_sql), params).fetchall()
-        data = [dict(row._mapping) for row in result]
 
-        return jsonable_encoder({
+        # orjson serializa os RowMapping direto (sem jsonable_encoder)
+        return ORJSONResposta({
             "status": "ok",
-            "data": data
+            "data": [row._mapping for row in result]
         })
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,12 @@
 from typing import Optional
 
 from fastapi import FastAPI, Depends, HTTPException, APIRouter
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy import text
 import traceback
 import logging
 from connection.db_connection import Base, engine, SessionLocal
+from wsh.consulta.campos import projecao
+from wsh.api.resposta import ORJSONResposta
 
 consult_prod_rp = APIRouter()
 
@@ -59,17 +60,20 @@ def get_putaway(id: int):
         db.close()
 
 
-@consult_prod_rp.get("/productsputaway")
-@consult_prod_rp.get("/productsputaway/{pn}")
+@consult_prod_rp.get("/productsputaway", response_class=ORJSONResposta)
+@consult_prod_rp.get("/productsputaway/{pn}", response_class=ORJSONResposta)
 def products_putaway(
     pn: Optional[str] = None,
     position: Optional[str] = None,
-    id: Optional[int] = None
+    id: Optional[int] = None,
+    fields: str = ""
 ):
     db = SessionLocal()
     try:
-        base_sql = """
-            SELECT *
+        campos = projecao(db, "whsproductsputaway", fields)
+
+        base_sql = f"""
+            SELECT {campos}
             FROM whsproductsputaway
             WHERE situationregistration != 'E'
         """
@@ -90,13 +94,15 @@ def products_putaway(
 
         result = db.execute(text(base_sql), params).fetchall()
 
-        data = [dict(row._mapping) for row in result]
-
-        return jsonable_encoder({
+        # orjson serializa os RowMapping direto (sem jsonable_encoder)
+        return ORJSONResposta({
             "status": "ok",
-            "data": data
+            "data": [row._mapping for row in result]
         })
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
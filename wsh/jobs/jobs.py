@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import func, text
+from connection.db_connection import SessionLocal
+from models import Job
+from wsh.middleware.log import novo_movlog, gravar_movlog
+
+jobs_rp = APIRouter()
+
+logger = logging.getLogger("jobs")
+logging.basicConfig(level=logging.INFO)
+
+# ------------------------------------------------------
+# CONFIGURAÇÃO
+# ------------------------------------------------------
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))
+JOBS_MAX_PENDENTES = int(os.getenv("JOBS_MAX_PENDENTES", "20"))
+JOBS_INTERVALO_PROGRESSO = 2.0  # segundos entre gravações de progresso
+# job em fila/rodando há mais tempo que isso é dado como perdido na subida
+# (é o único critério para jobs de outros hosts)
+JOBS_TIMEOUT_HORAS = int(os.getenv("JOBS_TIMEOUT_HORAS", "24"))
+
+_executor = ThreadPoolExecutor(max_workers=JOBS_MAX_WORKERS, thread_name_prefix="job")
+_lock = threading.Lock()
+_ativos = {}  # job_id -> Progresso (em fila ou rodando neste processo)
+
+# cada worker do uvicorn é um processo: o job pertence a quem o enfileirou
+HOST = socket.gethostname()
+DONO = f"{HOST}:{os.getpid()}"
+
+
+# ------------------------------------------------------
+# PROGRESSO
+# ------------------------------------------------------
+class Progresso:
+    """
+    Acompanhamento de fase e linhas processadas de uma rotina longa.
+
+    Sem job_id (chamada síncrona pela rota) só mantém os valores em memória;
+    dentro de um job grava na whsjobs no máximo a cada
+    JOBS_INTERVALO_PROGRESSO segundos.
+    """
+
+    def __init__(self, job_id: str = None, movlog: dict = None):
+        self.job_id = job_id
+        self.nome_fase = None
+        self.linhas = 0
+        self.inicio = time.time()
+        self.movlog = movlog if movlog is not None else novo_movlog()
+        self.fases = {}  # fase -> linhas, segundos e linhas/s
+        self._inicio_fase = None
+        self._linhas_fase = 0
+        self._ultima_gravacao = 0.0
+
+    def fase(self, nome: str):
+        self._fechar_fase()
+        self.nome_fase = nome
+        self._inicio_fase = time.time()
+        self._linhas_fase = self.linhas
+        logger.info(f"[JOB {self.job_id}] fase: {nome}")
+        self.gravar(forcar=True)
+
+    def avancar(self, linhas: int):
+        self.linhas += linhas or 0
+        self.gravar()
+
+    def _fechar_fase(self):
+        if self._inicio_fase is None:
+            return
+
+        decorrido = time.time() - self._inicio_fase
+        linhas = self.linhas - self._linhas_fase
+        self.fases[self.nome_fase] = {
+            "linhas": linhas,
+            "segundos": round(decorrido, 3),
+            "linhas_por_segundo": round(linhas / decorrido, 1) if decorrido > 0 else 0.0
+        }
+        self._inicio_fase = None
+
+    def resumo_fases(self) -> dict:
+        """Vazão de cada fase concluída (fecha a fase atual)."""
+        self._fechar_fase()
+        return dict(self.fases)
+
+    def linhas_por_segundo(self):
+        decorrido = time.time() - self.inicio
+        return round(self.linhas / decorrido, 1) if decorrido > 0 else 0.0
+
+    def gravar(self, forcar: bool = False):
+        if not self.job_id:
+            return
+
+        agora = time.time()
+        if not forcar and agora - self._ultima_gravacao < JOBS_INTERVALO_PROGRESSO:
+            return
+        self._ultima_gravacao = agora
+
+        atualizar_job(self.job_id, fase=self.nome_fase, linhas_processadas=self.linhas)
+
+
+def atualizar_job(job_id: str, **campos):
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(campos)
+        db.commit()
+    except Exception:
+        logger.exception(f"[JOB {job_id}] erro ao atualizar whsjobs")
+        db.rollback()
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------
+# EXECUÇÃO
+# ------------------------------------------------------
+def submeter_job(rota: str, funcao, *args, **kwargs) -> str:
+    """
+    Enfileira `funcao(db, progresso, *args, **kwargs)` no pool de workers e
+    devolve o id do job imediatamente. O retorno da função vira o resultado
+    do job (/jobs/{id}/result).
+    """
+    with _lock:
+        if len(_ativos) >= JOBS_MAX_PENDENTES:
+            raise HTTPException(status_code=429, detail="Fila de jobs cheia, tente novamente mais tarde")
+
+        job_id = str(uuid.uuid4())
+        _ativos[job_id] = Progresso(job_id)
+
+    db = SessionLocal()
+    try:
+        db.add(Job(id=job_id, rota=rota, status="QUEUED", dono=DONO))
+        db.commit()
+    except Exception:
+        # sem o registro na whsjobs o job não existe: libera a vaga na fila
+        with _lock:
+            _ativos.pop(job_id, None)
+        raise
+    finally:
+        db.close()
+
+    _executor.submit(_executar_job, job_id, rota, funcao, args, kwargs)
+    logger.info(f"[JOB {job_id}] enfileirado ({rota})")
+    return job_id
+
+
+def _executar_job(job_id, rota, funcao, args, kwargs):
+    progresso = _ativos[job_id]
+    progresso.inicio = time.time()
+    atualizar_job(job_id, status="RUNNING", started_at=datetime.now())
+
+    db = SessionLocal()
+    try:
+        resultado = funcao(db, progresso, *args, **kwargs)
+
+        atualizar_job(
+            job_id,
+            status="SUCCESS",
+            fase="concluido",
+            linhas_processadas=progresso.linhas,
+            resultado=json.dumps(resultado, ensure_ascii=False, default=str),
+            finished_at=datetime.now()
+        )
+        logger.info(f"[JOB {job_id}] concluído")
+
+    except Exception as e:
+        logger.exception(f"[JOB {job_id}] erro")
+        db.rollback()
+
+        detalhe = e.detail if isinstance(e, HTTPException) else str(e)
+        progresso.movlog["status"] = "ERROR"
+        progresso.movlog["descricao"] = str(detalhe)
+
+        atualizar_job(
+            job_id,
+            status="ERROR",
+            linhas_processadas=progresso.linhas,
+            erro=str(detalhe),
+            finished_at=datetime.now()
+        )
+
+    finally:
+        db.close()
+        gravar_movlog(rota, progresso.movlog, int((time.time() - progresso.inicio) * 1000))
+
+        with _lock:
+            _ativos.pop(job_id, None)
+
+
+def _processo_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # existe, só não é nosso
+    return True
+
+
+def _job_orfao(dono, expirado) -> bool:
+    dono = (dono or "").strip()
+    if not dono or expirado:
+        return True  # sem dono (anterior à coluna) ou parado há tempo demais
+
+    host, _, pid = dono.rpartition(":")
+    if host == HOST and pid.isdigit():
+        # este processo ainda não enfileirou nada na subida: job com o
+        # mesmo host:pid (restart com o mesmo pid) também é órfão
+        return pid == str(os.getpid()) or not _processo_vivo(int(pid))
+
+    return False  # outro host: só pelo timeout
+
+
+def marcar_jobs_interrompidos():
+    """
+    Na subida do worker, marca como interrompidos os jobs em fila/rodando
+    que não voltam mais: os deste host cujo processo dono morreu (ou é este
+    mesmo pid), os sem dono e os criados há mais de JOBS_TIMEOUT_HORAS.
+    Os demais jobs de workers irmãos vivos e de outros hosts não são tocados.
+    """
+    db = SessionLocal()
+    try:
+        expirado = Job.created_at < func.date_sub(func.now(), text(f"INTERVAL {JOBS_TIMEOUT_HORAS} HOUR"))
+        pendentes = db.query(Job.id, Job.dono, expirado).filter(
+            Job.status.in_(["QUEUED", "RUNNING"])
+        ).all()
+
+        orfaos = [job_id for job_id, dono, vencido in pendentes if _job_orfao(dono, vencido)]
+
+        if orfaos:
+            db.query(Job).filter(Job.id.in_(orfaos)).update(
+                {"status": "ERROR", "erro": "Interrompido pelo reinício da API", "finished_at": datetime.now()},
+                synchronize_session=False
+            )
+            db.commit()
+            logger.info(f"{len(orfaos)} job(s) órfão(s) marcados como interrompidos")
+    finally:
+        db.close()
+
+
+def encerrar_jobs():
+    _executor.shutdown(wait=True)
+
+
+# ======================================================
+#   ROTAS DE CONSULTA
+# ======================================================
+def buscar_job(job_id: str) -> Job:
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+    finally:
+        db.close()
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@jobs_rp.get("/jobs/{job_id}")
+def status_job(job_id: str):
+    job = buscar_job(job_id)
+    progresso = _ativos.get(job_id)
+
+    if progresso is not None and job.status == "RUNNING":
+        # progresso em memória é mais recente que o gravado
+        fase = progresso.nome_fase
+        linhas = progresso.linhas
+        linhas_por_segundo = progresso.linhas_por_segundo()
+    else:
+        fase = job.fase
+        linhas = job.linhas_processadas or 0
+        linhas_por_segundo = 0.0
+        if job.started_at and job.finished_at:
+            decorrido = (job.finished_at - job.started_at).total_seconds()
+            if decorrido > 0:
+                linhas_por_segundo = round(linhas / decorrido, 1)
+
+    return {
+        "job_id": job.id,
+        "rota": job.rota,
+        "status": job.status,
+        "fase": fase,
+        "linhas_processadas": linhas,
+        "linhas_por_segundo": linhas_por_segundo,
+        "criado_em": job.created_at,
+        "iniciado_em": job.started_at,
+        "finalizado_em": job.finished_at,
+        "erro": job.erro
+    }
+
+
+@jobs_rp.get("/jobs/{job_id}/result")
+def resultado_job(job_id: str):
+    job = buscar_job(job_id)
+
+    if job.status == "ERROR":
+        raise HTTPException(status_code=500, detail=job.erro)
+
+    if job.status != "SUCCESS":
+        raise HTTPException(status_code=409, detail=f"Job ainda em andamento ({job.status})")
+
+    return json.loads(job.resultado) if job.resultado else None
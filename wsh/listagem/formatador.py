@@ -0,0 +1,59 @@
+from datetime import datetime, date
+
+# ------------------------------------------------------
+# FORMATADOR DE LINHAS
+# ------------------------------------------------------
+# Compilado uma vez por formato de resultado (lista de colunas): cada coluna
+# de data recebe seu conversor pela posição, e as demais passam direto.
+FORMATO_DATA = "%d/%m/%Y"
+FORMATO_DATA_HORA = "%d/%m/%Y %H:%M:%S"
+
+
+def _conversor(formato: str):
+    def converter(valor):
+        if isinstance(valor, (datetime, date)):
+            return valor.strftime(formato)
+        try:
+            return datetime.fromisoformat(str(valor)).strftime(formato)
+        except ValueError:
+            return valor  # mantém o valor original se não conseguir converter
+    return converter
+
+
+_data = _conversor(FORMATO_DATA)
+_data_hora = _conversor(FORMATO_DATA_HORA)
+
+
+def compilar_formatador(colunas, campos_data=(), campos_data_hora=(), iso: bool = False):
+    """
+    Devolve uma função linha -> lista de valores na ordem de `colunas`,
+    com as datas em dd/mm/aaaa (campos_data) ou dd/mm/aaaa hh:mm:ss
+    (campos_data_hora). Com iso=True os valores saem como vieram do banco
+    e o encoder grava as datas em ISO 8601.
+    """
+    conversores = []
+    for posicao, coluna in enumerate(colunas):
+        if coluna in campos_data:
+            conversores.append((posicao, _data))
+        elif coluna in campos_data_hora:
+            conversores.append((posicao, _data_hora))
+
+    if iso or not conversores:
+        return list
+
+    def formatar(row):
+        valores = list(row)
+        for posicao, converter in conversores:
+            valor = valores[posicao]
+            if valor:
+                valores[posicao] = converter(valor)
+        return valores
+
+    return formatar
+
+
+def padrao_json(valor):
+    """default= do json.dumps: datas em ISO 8601, o resto como texto."""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
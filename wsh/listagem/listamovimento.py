@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 import logging
 from pydantic import BaseModel
 from connection.db_connection import SessionLocal
+from wsh.metrics.metrics import listageral_linhas
+from wsh.consulta.campos import projecao
+from wsh.listagem.formatador import compilar_formatador, padrao_json
+from wsh.api.resposta import dumps
 from typing import List, Optional
 from datetime import datetime, date
 import json
+import base64
+import csv
+import io
 
 listagem_rp = APIRouter()
 
@@ -24,6 +31,8 @@ def get_db():
         db.close()
 
 
+LISTAGERAL_YIELD_PER = 1000
+
 
 CAMPOS_DATA_SEM_HORA = {"grn1", "grn3"}
 CAMPOS_DATA_COM_HORA = {
@@ -33,6 +42,12 @@ CAMPOS_DATA_COM_HORA = {
     "DateProcessEnd",
     "dateregistration"
 }
+
+
+def formatador_listageral(colunas, iso: bool = False):
+    return compilar_formatador(colunas, CAMPOS_DATA_SEM_HORA, CAMPOS_DATA_COM_HORA, iso)
+
+
 def normaliza_data(valor):
     if valor is None:
         return None
@@ -40,31 +55,206 @@ def normaliza_data(valor):
         return None
     return valor
 
-def formatar_datas(row_dict: dict):
-    for campo in CAMPOS_DATA_SEM_HORA | CAMPOS_DATA_COM_HORA:
-        valor = row_dict.get(campo)
+# =========================================================================
+#   PAGINAÇÃO POR CHAVE (keyset) DO /listageral
+# =========================================================================
+LISTAGERAL_LIMITE_MAX = 10000
 
-        if not valor:
-            continue
 
-        try:
-            if isinstance(valor, (datetime, date)):
-                dt = valor
-            else:
-                dt = datetime.fromisoformat(str(valor))
+def codificar_cursor(ordem: int, valor, id_: int) -> str:
+    """Cursor opaco com a última posição lida: (ordem, valor da coluna, Id)."""
+    bruto = json.dumps([ordem, valor, id_], default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii")
+
+
+def decodificar_cursor(cursor: str, ordem: int):
+    try:
+        ordem_cursor, valor, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        id_ = int(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if ordem_cursor != ordem:
+        raise HTTPException(status_code=400, detail="Cursor gerado para outra ordenação")
+
+    return valor, id_
+
+
+def posicao_coluna(colunas, coluna: str) -> int:
+    # o nome em order_fields nem sempre tem a mesma caixa da coluna (AAF x aaf)
+    if coluna in colunas:
+        return colunas.index(coluna)
+    return [c.lower() for c in colunas].index(coluna.lower())
+
+
+def aplicar_keyset(sql: str, params: dict, coluna: str, ordem: int, cursor: str) -> str:
+    """
+    Acrescenta a condição "depois do cursor" e o ORDER BY (coluna, Id).
+    No MySQL os NULLs vêm primeiro em ordem crescente.
+    """
+    if cursor:
+        valor, id_ = decodificar_cursor(cursor, ordem)
+        params["cursor_id"] = id_
+
+        if coluna == "Id":
+            sql += " AND Id > :cursor_id"
+        elif valor is None:
+            sql += f" AND (({coluna} IS NULL AND Id > :cursor_id) OR {coluna} IS NOT NULL)"
+        else:
+            sql += f" AND ({coluna} > :cursor_valor OR ({coluna} = :cursor_valor AND Id > :cursor_id))"
+            params["cursor_valor"] = valor
+
+    if coluna == "Id":
+        return sql + " ORDER BY Id"
+    return sql + f" ORDER BY {coluna}, Id"
+
+
+def pagina_listageral(db, sql, params, coluna, ordem, limit, iso):
+    params["limite"] = limit + 1
+    result = db.execute(text(sql + " LIMIT :limite"), params)
+    colunas = list(result.keys())
+    rows = result.fetchall()
+
+    formatar = formatador_listageral(colunas, iso)
+    dados = [dict(zip(colunas, formatar(row))) for row in rows[:limit]]
+    next_cursor = None
+
+    # uma linha a mais que o limite indica que existe próxima página;
+    # o cursor usa os valores crus (antes da formatação das datas)
+    if len(rows) > limit:
+        ultimo = rows[limit - 1]
+        next_cursor = codificar_cursor(
+            ordem,
+            ultimo[posicao_coluna(colunas, coluna)],
+            ultimo[posicao_coluna(colunas, "Id")]
+        )
+
+    listageral_linhas.inc(len(dados))
+
+    conteudo = dumps(
+        {"success": True, "data": dados, "next_cursor": next_cursor},
+        decimal_texto=True,
+        datas_texto=not iso
+    )
+    return Response(content=conteudo, media_type="application/json")
 
-            if campo in CAMPOS_DATA_SEM_HORA:
-                row_dict[campo] = dt.strftime("%d/%m/%Y")
+
+# =========================================================================
+#   FORMATOS DE EXPORTAÇÃO DO /listageral
+# =========================================================================
+FORMATOS_LISTAGERAL = {
+    "json": "application/json",
+    "columnar": "application/vnd.wsh.columnar+json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+ACCEPT_FORMATO = {
+    "application/vnd.wsh.columnar+json": "columnar",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "text/csv": "csv",
+    "application/json": "json",
+}
+
+
+def escolher_formato(formato: str, accept: str) -> str:
+    """?formato= tem prioridade; senão o primeiro tipo conhecido do Accept; padrão json."""
+    if formato:
+        formato = formato.lower()
+        if formato not in FORMATOS_LISTAGERAL:
+            raise HTTPException(
+                status_code=400,
+                detail=f"formato inválido, use: {', '.join(FORMATOS_LISTAGERAL)}"
+            )
+        return formato
+
+    for tipo in accept.split(","):
+        tipo = tipo.split(";")[0].strip().lower()
+        if tipo in ACCEPT_FORMATO:
+            return ACCEPT_FORMATO[tipo]
+
+    return "json"
+
+
+
+
+def _csv_bloco(linhas) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\r\n").writerows(linhas)
+    return buffer.getvalue()
+
+
+def stream_listageral(db, sql, params, formato, iso=False):
+    """
+    Gera o corpo do /listageral no formato pedido, um bloco por vez.
+
+    json     -> {"success": true, "data": [{coluna: valor, ...}, ...]}
+    columnar -> {"success": true, "columns": [...], "rows": [[...], ...]}
+    ndjson   -> um objeto JSON por linha
+    csv      -> cabeçalho + uma linha por registro
+
+    O formatador das linhas é compilado uma vez, a partir das colunas do
+    resultado; com iso=True as datas saem em ISO 8601 sem reformatação.
+    """
+    # Decimal como texto e, fora do modo iso, datas como str() (igual ao
+    # json.dumps(default=str) de antes)
+    def _json(valor) -> bytes:
+        return dumps(valor, decimal_texto=True, datas_texto=not iso)
+
+    # cursor no servidor (SSCursor): as linhas chegam em blocos de
+    # LISTAGERAL_YIELD_PER e a memória não cresce com o tamanho do resultado
+    result = db.execute(
+        text(sql),
+        params,
+        execution_options={"stream_results": True, "yield_per": LISTAGERAL_YIELD_PER}
+    )
+
+    linhas = 0
+
+    try:
+        colunas = list(result.keys())
+        formatar = formatador_listageral(colunas, iso)
+
+        if formato == "json":
+            yield b'{"success": true, "data": ['
+        elif formato == "columnar":
+            yield b'{"success": true, "columns": ' + _json(colunas) + b', "rows": ['
+        elif formato == "csv":
+            yield _csv_bloco([colunas]).encode("utf-8")
+
+        for bloco in result.partitions():
+            registros = [formatar(row) for row in bloco]
+
+            if formato == "csv":
+                if iso:
+                    registros = [[padrao_json(v) if isinstance(v, (datetime, date)) else v for v in r] for r in registros]
+                pedaco = _csv_bloco(registros).encode("utf-8")
+            elif formato == "ndjson":
+                pedaco = b"".join(_json(dict(zip(colunas, r))) + b"\n" for r in registros)
             else:
-                row_dict[campo] = dt.strftime("%d/%m/%Y %H:%M:%S")
+                if formato == "json":
+                    registros = [dict(zip(colunas, r)) for r in registros]
+
+                # um dumps por bloco; tira os [ ] do array gerado
+                pedaco = _json(registros)[1:-1]
+                if linhas and pedaco:
+                    pedaco = b"," + pedaco
 
-        except Exception:
-            pass  # mantém o valor original se não conseguir converter
+            linhas += len(registros)
+            yield pedaco
+
+    finally:
+        result.close()
+        listageral_linhas.inc(linhas)
+
+    if formato in ("json", "columnar"):
+        yield b"]}"
 
-    return row_dict
 
 @listagem_rp.get("/listageral")
 def get_listageral(
+    request: Request,
     tipo: str,
     controle: str = "",
     waybill: str = "",
@@ -78,26 +268,53 @@ def get_listageral(
     datafim: str = "",
     data_tipo: str = "",
     ordem: int = 0,
+    limit: int = 0,
+    cursor: str = "",
+    formato: str = "",
+    fields: str = "",
+    iso: int = 0,
     db: Session = Depends(get_db)
 ):
 
     logger.info("📌 Iniciando rota /listageral (STREAMING)")
 
+    # limit=0 -> sem paginação (streaming da lista inteira)
+    if limit < 0 or limit > LISTAGERAL_LIMITE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit deve estar entre 0 (sem paginação) e {LISTAGERAL_LIMITE_MAX}"
+        )
+
     tabela = "whsproductsputaway" if tipo == "G" else "whsproductsputawaylog"
-    sql = f"SELECT * FROM {tabela} WHERE Id > 0"
+
+    # PN e Reference têm índice (coluna, Id) para o keyset (connection.schema)
+    order_fields = [
+        "", "Id", "User_Id", "PN", "Description", "Qty", "RevisedQty",
+        "Position", "dateregistration", "siccode", "Reference", "Waybill",
+        "operator_id", "processlines", "AAF", "grn1", "grn",
+        "GRN3", "RNC", "processdate"
+    ]
+
+    coluna_ordem = order_fields[ordem] if ordem > 0 else "Id"
+
+    # no modo página a coluna de ordenação e o Id formam o cursor
+    obrigatorios = ("Id", coluna_ordem) if limit > 0 else ()
+    campos = projecao(db, tabela, fields, obrigatorios=obrigatorios)
+
+    sql = f"SELECT {campos} FROM {tabela} WHERE Id > 0"
     params = {}
 
     if controle:
-        sql += " AND TRIM(Reference) = :controle"
-        params["controle"] = controle
+        sql += " AND ReferenceKey = :controle"
+        params["controle"] = controle.strip()
 
     if waybill:
-        sql += " AND TRIM(Waybill) = :waybill"
-        params["waybill"] = waybill
+        sql += " AND WaybillKey = :waybill"
+        params["waybill"] = waybill.strip()
 
     if codigoitem:
-        sql += " AND TRIM(PN) = :pn"
-        params["pn"] = codigoitem
+        sql += " AND PNKey = :pn"
+        params["pn"] = codigoitem.strip()
 
     if situacao == 0:
         sql += " AND situationregistration <> 'E'"
@@ -147,73 +364,23 @@ def get_listageral(
         params["dataini"] = dataini
         params["datafim"] = datafim
 
-    order_fields = [
-        "", "Id", "User_Id", "PN", "Description", "Qty", "RevisedQty",
-        "Position", "dateregistration", "siccode", "Reference", "Waybill",
-        "operator_id", "processlines", "AAF", "grn1", "grn",
-        "GRN3", "RNC", "processdate"
-    ]
-
-    if ordem > 0:
+    if limit > 0:
+        # modo página: ORDER BY (coluna, Id) + posição do cursor
+        sql = aplicar_keyset(sql, params, coluna_ordem, ordem, cursor)
+    elif ordem > 0:
         sql += f" ORDER BY {order_fields[ordem]}"
 
     logger.info(f"🟦 SQL Streaming:\n{sql}")
 
-    from datetime import datetime, date
-
-    CAMPOS_DATA_SEM_HORA = {"grn1", "grn3"}
-    CAMPOS_DATA_COM_HORA = {
-        "datecreate",
-        "aaf",
-        "dateregistration",
-        "DateProcessStart",
-        "DateProcessEnd"
-    }
-
-    def formatar_datas(row_dict: dict):
-        for campo in CAMPOS_DATA_SEM_HORA | CAMPOS_DATA_COM_HORA:
-            valor = row_dict.get(campo)
-
-            if not valor:
-                continue
+    if limit > 0:
+        return pagina_listageral(db, sql, params, coluna_ordem, ordem, limit, iso == 1)
 
-            try:
-                if isinstance(valor, (datetime, date)):
-                    dt = valor
-                else:
-                    dt = datetime.fromisoformat(str(valor))
-
-                if campo in CAMPOS_DATA_SEM_HORA:
-                    row_dict[campo] = dt.strftime("%d/%m/%Y")
-                else:
-                    row_dict[campo] = dt.strftime("%d/%m/%Y %H:%M:%S")
-
-            except Exception:
-                pass
-
-        return row_dict
-
-    def stream():
-        yield b'{"success": true, "data": ['
-
-        first = True
-        result = db.execute(text(sql), params)
-
-        for row in result:
-            if not first:
-                yield b","
-            first = False
-
-            row_dict = dict(row._mapping)
-            row_dict = formatar_datas(row_dict)
-
-            yield json.dumps(row_dict, default=str).encode("utf-8")
-
-        yield b"]}"
+    formato = escolher_formato(formato, request.headers.get("accept", ""))
+    logger.info(f"🟦 Formato: {formato}")
 
     return StreamingResponse(
-        stream(),
-        media_type="application/json"
+        stream_listageral(db, sql, params, formato, iso == 1),
+        media_type=FORMATOS_LISTAGERAL[formato]
     )
 
 
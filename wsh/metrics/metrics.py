@@ -0,0 +1,187 @@
+import threading
+from bisect import bisect_left
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from connection.instrumentacao import PoolMedido
+
+metrics_rp = APIRouter()
+
+# ------------------------------------------------------
+# PRIMITIVAS (formato de exposição texto do Prometheus)
+# ------------------------------------------------------
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=None) -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, *rotulos):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def expor(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        if not itens and not self.rotulos:
+            itens = [((), 0)]
+        for rotulos, valor in itens:
+            linhas.append(f"{self.nome}{_rotulos(self.rotulos, rotulos)} {_numero(valor)}")
+        return linhas
+
+
+class Medidor:
+    """Gauge: valor definido na hora (inc/dec) ou lido por função na coleta."""
+
+    def __init__(self, nome, ajuda, funcao=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self._valor = 0
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1):
+        with self._lock:
+            self._valor += valor
+
+    def dec(self, valor=1):
+        with self._lock:
+            self._valor -= valor
+
+    def expor(self):
+        valor = self.funcao() if self.funcao else self._valor
+        return [
+            f"# HELP {self.nome} {self.ajuda}",
+            f"# TYPE {self.nome} gauge",
+            f"{self.nome} {_numero(valor)}",
+        ]
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # rotulos -> [contagens por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [0] * (len(self.buckets) + 2)
+            if indice < len(self.buckets):
+                serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def expor(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = sorted((r, list(s)) for r, s in self._series.items())
+
+        for rotulos, serie in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie):
+                acumulado += contagem
+                le = 'le="' + _numero(limite) + '"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, rotulos, le)} {serie[-1]}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(serie[-2])}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {serie[-1]}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+
+    def registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def expor(self) -> str:
+        linhas = []
+        for metrica in self.metricas:
+            linhas.extend(metrica.expor())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+# ------------------------------------------------------
+# MÉTRICAS DA API
+# ------------------------------------------------------
+http_duracao = registro.registrar(Histograma(
+    "wsh_http_request_duration_seconds",
+    "Tempo da requisição até o último byte do corpo, por rota",
+    rotulos=("method", "route", "status")
+))
+
+http_em_andamento = registro.registrar(Medidor(
+    "wsh_http_requests_in_flight",
+    "Requisições em andamento"
+))
+
+listageral_linhas = registro.registrar(Contador(
+    "wsh_listageral_rows_streamed_total",
+    "Linhas enviadas pelo /listageral"
+))
+
+pool_espera = registro.registrar(Histograma(
+    "wsh_db_pool_wait_seconds",
+    "Tempo de espera para obter uma conexão do pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+))
+
+
+def registrar_pool(engine):
+    """Medidores do pool do SQLAlchemy, lidos na hora da coleta."""
+    # engine.pool é lido a cada coleta: o SQLAlchemy recria o pool após dispose()
+    registro.registrar(Medidor("wsh_db_pool_size", "Tamanho configurado do pool", lambda: engine.pool.size()))
+    registro.registrar(Medidor("wsh_db_pool_checked_out", "Conexões em uso", lambda: engine.pool.checkedout()))
+    registro.registrar(Medidor(
+        "wsh_db_pool_overflow", "Conexões acima do tamanho do pool", lambda: engine.pool.overflow()
+    ))
+    PoolMedido.observar_espera = staticmethod(pool_espera.observar)
+
+
+def registrar_fila_movlog(writer):
+    registro.registrar(Medidor(
+        "wsh_movlog_queue_depth",
+        "Registros aguardando gravação na movlog",
+        writer.fila.qsize
+    ))
+
+
+# ======================================================
+#   ROTA
+# ======================================================
+@metrics_rp.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registro.expor(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,133 @@
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+# ------------------------------------------------------
+# CONFIGURAÇÃO
+# ------------------------------------------------------
+COMPRESSAO_MINIMO = int(os.getenv("COMPRESSAO_MINIMO", "1024"))  # bytes
+COMPRESSAO_NIVEL = int(os.getenv("COMPRESSAO_NIVEL", "6"))
+
+# gzip: cabeçalho gzip (wbits 16+); deflate no HTTP é o formato zlib
+WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+TIPOS_IGNORADOS = ("text/event-stream", "image/", "application/zip", "application/gzip")
+
+
+def escolher_codificacao(accept_encoding: str):
+    """gzip ou deflate conforme o Accept-Encoding (respeita q=0); None se nenhum."""
+    aceitos = {}
+    for item in accept_encoding.lower().split(","):
+        partes = [p.strip() for p in item.split(";")]
+        nome = partes[0]
+        q = 1.0
+        for p in partes[1:]:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        aceitos[nome] = q
+
+    for nome in ("gzip", "deflate"):
+        q = aceitos.get(nome, aceitos.get("*", 0.0))
+        if q > 0:
+            return nome
+    return None
+
+
+class CompressaoMiddleware:
+    """
+    Compressão gzip/deflate negociada pelo Accept-Encoding, incremental.
+
+    O corpo é acumulado só até COMPRESSAO_MINIMO bytes: respostas menores
+    saem sem compressão. Acima disso cada pedaço é comprimido e enviado com
+    Z_SYNC_FLUSH, então uma StreamingResponse continua chegando aos poucos
+    no cliente.
+    """
+
+    def __init__(self, app, minimo: int = COMPRESSAO_MINIMO, nivel: int = COMPRESSAO_NIVEL):
+        self.app = app
+        self.minimo = minimo
+        self.nivel = nivel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacao = escolher_codificacao(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None          # http.response.start retido até decidir
+        pendente = []          # pedaços retidos abaixo do mínimo
+        tamanho = 0
+        compressor = None
+        direto = False         # resposta segue sem compressão
+
+        async def enviar_comprimido(corpo: bytes, mais: bool):
+            if mais:
+                dados = compressor.compress(corpo) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                dados = compressor.compress(corpo) + compressor.flush()
+            await send({"type": "http.response.body", "body": dados, "more_body": mais})
+
+        async def send_compressao(message):
+            nonlocal inicio, tamanho, compressor, direto
+
+            if direto:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                tipo = headers.get("content-type", "")
+                if "content-encoding" in headers or tipo.startswith(TIPOS_IGNORADOS):
+                    direto = True
+                    await send(message)
+                    return
+                inicio = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            corpo = message.get("body", b"")
+            mais = message.get("more_body", False)
+
+            if compressor is not None:
+                await enviar_comprimido(corpo, mais)
+                return
+
+            pendente.append(corpo)
+            tamanho += len(corpo)
+
+            if tamanho < self.minimo:
+                if mais:
+                    return
+                # terminou abaixo do mínimo: vai como veio
+                direto = True
+                await send(inicio)
+                await send({"type": "http.response.body", "body": b"".join(pendente), "more_body": False})
+                return
+
+            # passou do mínimo: a partir daqui tudo sai comprimido
+            compressor = zlib.compressobj(self.nivel, zlib.DEFLATED, WBITS[codificacao])
+            headers = MutableHeaders(raw=inicio["headers"])
+            headers["Content-Encoding"] = codificacao
+            headers.add_vary_header("Accept-Encoding")
+
+            if mais:
+                del headers["Content-Length"]
+                await send(inicio)
+                await enviar_comprimido(b"".join(pendente), True)
+            else:
+                dados = compressor.compress(b"".join(pendente)) + compressor.flush()
+                headers["Content-Length"] = str(len(dados))
+                await send(inicio)
+                await send({"type": "http.response.body", "body": dados, "more_body": False})
+
+        await self.app(scope, receive, send_compressao)
@@ -0,0 +1,104 @@
+import os
+import zlib
+from fastapi import HTTPException
+
+# ------------------------------------------------------
+# CONFIGURAÇÃO
+# ------------------------------------------------------
+# limite do corpo depois de descomprimido (protege contra "gzip bomb")
+DESCOMPRESSAO_MAX_MB = int(os.getenv("DESCOMPRESSAO_MAX_MB", "256"))
+
+ROTAS_IMPORTACAO = {
+    "/products",
+    "/products/stream",
+    "/products/delta",
+    "/products/delta/buckets",
+    "/romaneio",
+    "/romaneio/stream",
+    "/importar/a020_a190",
+    "/whsaurora071/import",
+    "/auroraAAF/process",
+}
+
+WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class DescompressaoMiddleware:
+    """
+    Aceita corpo com Content-Encoding gzip/deflate nas rotas de importação.
+
+    O corpo é descomprimido pedaço a pedaço conforme a rota lê o receive(),
+    sem juntar o arquivo comprimido em memória. Passou de
+    DESCOMPRESSAO_MAX_MB -> 413; gzip corrompido, truncado ou com bytes
+    depois do fim do stream -> 400.
+    """
+
+    def __init__(self, app, rotas=ROTAS_IMPORTACAO, max_bytes: int = DESCOMPRESSAO_MAX_MB * 1024 * 1024):
+        self.app = app
+        self.rotas = set(rotas)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.rotas:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        codificacao = headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+
+        if codificacao not in WBITS:
+            await self.app(scope, receive, send)
+            return
+
+        # a rota passa a ver um corpo comum: sem Content-Encoding/Content-Length.
+        # Altera o próprio scope (não uma cópia): o router grava scope["route"]
+        # nele e o MetricsMiddleware lê o rótulo da rota dali
+        scope["headers"] = [
+            (k, v) for k, v in scope["headers"]
+            if k not in (b"content-encoding", b"content-length")
+        ]
+
+        descompressor = zlib.decompressobj(WBITS[codificacao])
+        total = 0
+
+        def descomprimir(dados: bytes) -> bytes:
+            nonlocal total
+            partes = []
+
+            try:
+                while dados:
+                    # max_length: nunca gera mais que o limite de uma vez
+                    saida = descompressor.decompress(dados, self.max_bytes - total + 1)
+                    total += len(saida)
+                    if total > self.max_bytes:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Corpo descomprimido excede {self.max_bytes // (1024 * 1024)} MB"
+                        )
+                    partes.append(saida)
+                    dados = descompressor.unconsumed_tail
+            except zlib.error as e:
+                raise HTTPException(status_code=400, detail=f"Corpo {codificacao} inválido: {e}")
+
+            if descompressor.unused_data:
+                raise HTTPException(status_code=400, detail=f"Dados após o fim do corpo {codificacao}")
+
+            return b"".join(partes)
+
+        async def receive_descomprimido():
+            message = await receive()
+
+            if message["type"] != "http.request":
+                return message
+
+            corpo = descomprimir(message.get("body", b""))
+            mais = message.get("more_body", False)
+
+            if not mais:
+                corpo += descompressor.flush()
+                if not descompressor.eof:
+                    raise HTTPException(status_code=400, detail=f"Corpo {codificacao} incompleto")
+
+            return {"type": "http.request", "body": corpo, "more_body": mais}
+
+        await self.app(scope, receive_descomprimido, send)
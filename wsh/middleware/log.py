@@ -1,75 +1,332 @@
-from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi import Request
+import os
+import json
 import time
+import queue
+import threading
+from datetime import timedelta
 from sqlalchemy import text
 from connection.db_connection import SessionLocal
+from connection.instrumentacao import iniciar_medicao
 import logging
 
 
 
 logger = logging.getLogger("movlog")
 
+
+def novo_movlog():
+    """Contexto padrão do movlog de uma requisição (ou job)."""
+    return {
+        "inserts": 0,
+        "updates": 0,
+        "total": 0,
+        "usuario": None,
+        "descricao": None,
+        "status": "SUCCESS"
+    }
+
+
 # ------------------------------------------------------
-# CONEXÃO
+# GRAVAÇÃO EM LOTE (FORA DO CAMINHO DA REQUISIÇÃO)
 # ------------------------------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+MOVLOG_FLUSH_REGISTROS = int(os.getenv("MOVLOG_FLUSH_REGISTROS", "100"))
+MOVLOG_FLUSH_MS = int(os.getenv("MOVLOG_FLUSH_MS", "1000"))
+MOVLOG_FILA_MAX = int(os.getenv("MOVLOG_FILA_MAX", "10000"))
+MOVLOG_SPILL_FILE = os.getenv("MOVLOG_SPILL_FILE", "movlog_spill.jsonl")
+# registros que o banco recusou no replay do spill (não voltam para a fila)
+MOVLOG_REJEITADOS_FILE = MOVLOG_SPILL_FILE + ".rejeitados"
 
-class MovLogMiddleware(BaseHTTPMiddleware):
+INSERT_MOVLOG_SQL = """
+    INSERT INTO movlog 
+        (rota,
+         registros_inseridos,
+         registros_atualizados,
+         total_processado,
+         usuario,
+         descricao,
+         status,
+         tempo_ms,
+         sql_statements,
+         sql_rows,
+         sql_ms,
+         data_hora)
+    VALUES 
+        (:rota,
+         :ins,
+         :upd,
+         :total,
+         :usuario,
+         :descricao,
+         :status,
+         :tempo,
+         :sql_statements,
+         :sql_rows,
+         :sql_ms,
+         :data_hora)
+"""
 
-    async def dispatch(self, request: Request, call_next):
+CAMPOS_MOVLOG = (
+    "rota", "ins", "upd", "total", "usuario", "descricao", "status",
+    "tempo", "sql_statements", "sql_rows", "sql_ms"
+)
 
-        start_time = time.time()
-        response = None
 
-        logger.info(f"[MOVLOG] INICIO {request.method} {request.url.path}")
+def relogio_banco(db):
+    """
+    (NOW(6) do banco, time.time() local) lidos juntos. data_hora continua
+    no relógio do banco, mas vai como parâmetro comum: com uma expressão no
+    VALUES o executemany do PyMySQL não monta o INSERT de várias linhas.
+    """
+    return db.execute(text("SELECT NOW(6)")).scalar(), time.time()
 
-        # ==================================================
-        # contexto padrão
-        # ==================================================
-        request.state.movlog = {
-            "inserts": 0,
-            "updates": 0,
-            "total": 0,
-            "usuario": None,
-            "descricao": None,
-            "status": "SUCCESS"
-        }
 
+def parametros_movlog(registro: dict, relogio) -> dict:
+    """Parâmetros do INSERT; desconta de data_hora o tempo que o registro passou na fila/spill."""
+    agora_banco, agora_local = relogio
+    parametros = {campo: registro.get(campo) for campo in CAMPOS_MOVLOG}
+    atraso = max(0.0, agora_local - registro.get("enfileirado_em", agora_local))
+    parametros["data_hora"] = agora_banco - timedelta(seconds=atraso)
+    return parametros
+
+
+class MovLogWriter:
+    """
+    Fila em memória + thread de gravação da movlog.
+
+    A requisição só enfileira o registro; a thread grava com executemany a
+    cada MOVLOG_FLUSH_REGISTROS registros ou MOVLOG_FLUSH_MS milissegundos.
+    Se o banco estiver fora, o lote vai para MOVLOG_SPILL_FILE (JSON por
+    linha). Na próxima subida a thread regrava o spill linha a linha: linha
+    ilegível (spill cortado no meio) ou que o banco recusar vai para
+    MOVLOG_REJEITADOS_FILE em vez de voltar ao spill.
+    """
+
+    def __init__(self):
+        self.fila = queue.Queue(maxsize=MOVLOG_FILA_MAX)
+        self._parar = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="movlog-writer", daemon=True)
+        self._thread.start()
+        logger.info("[MOVLOG] writer iniciado")
+
+    def parar(self):
+        """Drena a fila e encerra a thread (chamado no shutdown)."""
+        if self._thread is None:
+            return
+
+        self._parar.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("[MOVLOG] writer encerrado")
+
+    def enfileirar(self, registro: dict):
         try:
-            logger.info("[MOVLOG] -> call_next")
-            response = await call_next(request)
-            logger.info(f"[MOVLOG] <- call_next OK ({response.status_code})")
+            self.fila.put_nowait(registro)
+        except queue.Full:
+            logger.warning("[MOVLOG] fila cheia, registro enviado ao spill")
+            self._spill([registro])
+
+    def _loop(self):
+        try:
+            self._recuperar_spill()
+        except Exception:
+            # o replay nunca pode derrubar a thread: sem ela tudo vira spill
+            logger.exception("[MOVLOG] ERRO ao regravar o spill")
+
+        while not self._parar.is_set():
+            self._flush(self._coletar())
+
+        # shutdown: drena tudo o que sobrou
+        while not self.fila.empty():
+            self._flush(self._coletar(espera=0))
+
+    def _coletar(self, espera=None):
+        espera = MOVLOG_FLUSH_MS / 1000 if espera is None else espera
+        limite = time.time() + espera
+        lote = []
+
+        while len(lote) < MOVLOG_FLUSH_REGISTROS:
+            restante = limite - time.time()
+            try:
+                if restante <= 0:
+                    lote.append(self.fila.get_nowait())
+                else:
+                    lote.append(self.fila.get(timeout=restante))
+            except queue.Empty:
+                break
+
+        return lote
+
+    def _flush(self, lote):
+        if not lote:
+            return
+
+        db = SessionLocal()
+        try:
+            relogio = relogio_banco(db)
+            db.execute(text(INSERT_MOVLOG_SQL), [parametros_movlog(r, relogio) for r in lote])
+            db.commit()
+            logger.info(f"[MOVLOG] {len(lote)} registros gravados")
 
         except Exception as e:
-            logger.exception("[MOVLOG] ERRO na rota")
+            logger.exception(f"[MOVLOG] ERRO ao gravar movlog: {e}")
+            db.rollback()
+            self._spill(lote)
 
-            request.state.movlog["status"] = "ERROR"
-            request.state.movlog["descricao"] = str(e)
+        finally:
+            db.close()
 
-            raise
+    def _spill(self, lote, arquivo: str = MOVLOG_SPILL_FILE):
+        self._guardar_linhas([json.dumps(r, ensure_ascii=False, default=str) for r in lote], arquivo)
 
+    def _guardar_linhas(self, linhas, arquivo: str):
+        with self._spill_lock:
+            with open(arquivo, "a", encoding="utf-8") as f:
+                for linha in linhas:
+                    f.write(linha.rstrip("\n") + "\n")
+
+    def _banco_no_ar(self) -> bool:
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
         finally:
-            logger.info("[MOVLOG] finally iniciado")
+            db.close()
+
+    def _recuperar_spill(self):
+        # cada worker tenta tomar o arquivo para si; quem perde a corrida
+        # (FileNotFoundError) simplesmente não tem nada a regravar. O nome leva
+        # pid e hora: depois de um restart o pid costuma ser o mesmo
+        pendente = f"{MOVLOG_SPILL_FILE}.{os.getpid()}.{time.time_ns()}.replay"
+        try:
+            os.replace(MOVLOG_SPILL_FILE, pendente)
+        except FileNotFoundError:
+            return
+
+        with open(pendente, encoding="utf-8", errors="replace") as f:
+            linhas = [linha for linha in f if linha.strip()]
+
+        gravados = rejeitados = 0
+        relogio = None
+        for pos, linha in enumerate(linhas):
+            try:
+                registro = json.loads(linha)
+                if not isinstance(registro, dict):
+                    raise ValueError("linha não é um objeto JSON")
+            except ValueError as e:
+                # normalmente a última linha, cortada quando o processo morreu
+                logger.error(f"[MOVLOG] linha ilegível no spill, movida para {MOVLOG_REJEITADOS_FILE}: {e}")
+                self._guardar_linhas([linha], MOVLOG_REJEITADOS_FILE)
+                rejeitados += 1
+                continue
+
+            db = SessionLocal()
+            try:
+                if relogio is None:
+                    relogio = relogio_banco(db)
+                db.execute(text(INSERT_MOVLOG_SQL), parametros_movlog(registro, relogio))
+                db.commit()
+                gravados += 1
+
+            except Exception as e:
+                db.rollback()
+                if not self._banco_no_ar():
+                    # banco fora de novo: o resto volta para o spill
+                    self._guardar_linhas(linhas[pos:], MOVLOG_SPILL_FILE)
+                    break
+                logger.error(f"[MOVLOG] registro do spill recusado, movido para {MOVLOG_REJEITADOS_FILE}: {e}")
+                self._guardar_linhas([linha], MOVLOG_REJEITADOS_FILE)
+                rejeitados += 1
+
+            finally:
+                db.close()
+
+        os.remove(pendente)
+        logger.info(f"[MOVLOG] spill: {gravados} registros regravados, {rejeitados} rejeitados")
+
+
+movlog_writer = MovLogWriter()
+
+
+def gravar_movlog(rota: str, data: dict, duration: int):
+    """Enfileira uma linha da movlog (usado pelo middleware e pelos jobs)."""
+    movlog_writer.enfileirar({
+        "rota": rota,
+        "ins": data.get("inserts", 0),
+        "upd": data.get("updates", 0),
+        "total": data.get("total", 0),
+        "usuario": data.get("usuario"),
+        "descricao": data.get("descricao"),
+        "status": data.get("status", "SUCCESS"),
+        "tempo": duration,
+        "sql_statements": data.get("sql_statements"),
+        "sql_rows": data.get("sql_rows"),
+        "sql_ms": data.get("sql_ms"),
+        "enfileirado_em": time.time()
+    })
+
+
+class MovLogMiddleware:
+    """
+    Middleware ASGI puro da movlog.
+
+    Mantém o contrato request.state.movlog das rotas e mede tempo_ms até o
+    último pedaço do corpo ser enviado (vale também para StreamingResponse).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        request = Request(scope)
+        status_code = None
+        registrado = False
+
+        logger.info(f"[MOVLOG] INICIO {request.method} {request.url.path}")
+
+        # ==================================================
+        # contexto padrão
+        # ==================================================
+        request.state.movlog = novo_movlog()
+        estatisticas_sql = iniciar_medicao()
+
+        def registrar():
+            nonlocal registrado
+            if registrado:
+                return
+            registrado = True
 
             duration = int((time.time() - start_time) * 1000)
 
             data = getattr(request.state, "movlog", {})
+            data["sql_statements"] = estatisticas_sql["sql_statements"]
+            data["sql_rows"] = estatisticas_sql["sql_rows"]
+            data["sql_ms"] = int(estatisticas_sql["sql_ms"])
 
             inserts = data.get("inserts", 0)
             updates = data.get("updates", 0)
             total = data.get("total", 0)
-
-            usuario = data.get("usuario")
-            descricao = data.get("descricao")
             status = data.get("status", "SUCCESS")
 
             logger.info(
-                f"[MOVLOG] dados -> inserts={inserts}, updates={updates}, total={total}, status={status}"
+                f"[MOVLOG] dados -> inserts={inserts}, updates={updates}, total={total}, "
+                f"status={status}, http={status_code}, tempo_ms={duration}, "
+                f"sql={data['sql_statements']} ({data['sql_ms']} ms, {data['sql_rows']} linhas)"
             )
 
             # ==================================================
@@ -77,66 +334,33 @@ class MovLogMiddleware(BaseHTTPMiddleware):
             # ==================================================
             if (inserts + updates) == 0 and status != "ERROR" and total == 0:
                 logger.info("[MOVLOG] ignorado (sem impacto)")
-                return response
+                return
 
-            # ==================================================
-            # 🔥 conexão no seu padrão ORIGINAL
-            # ==================================================
-            db_gen = get_db()
-            db = next(db_gen)
+            gravar_movlog(request.url.path, data, duration)
 
-            try:
-                logger.info("[MOVLOG] executando INSERT movlog")
-
-                db.execute(
-                    text("""
-                        INSERT INTO movlog 
-                            (rota,
-                             registros_inseridos,
-                             registros_atualizados,
-                             total_processado,
-                             usuario,
-                             descricao,
-                             status,
-                             tempo_ms,
-                             data_hora)
-                        VALUES 
-                            (:rota,
-                             :ins,
-                             :upd,
-                             :total,
-                             :usuario,
-                             :descricao,
-                             :status,
-                             :tempo,
-                             NOW())
-                    """),
-                    {
-                        "rota": request.url.path,
-                        "ins": inserts,
-                        "upd": updates,
-                        "total": total,
-                        "usuario": usuario,
-                        "descricao": descricao,
-                        "status": status,
-                        "tempo": duration
-                    }
-                )
+        async def send_movlog(message):
+            nonlocal status_code
 
-                db.commit()
-                logger.info("[MOVLOG] INSERT OK")
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
 
-            except Exception as e:
-                logger.exception(f"[MOVLOG] ERRO ao gravar movlog: {e}")
-                db.rollback()
+            await send(message)
 
-            finally:
-                # 🔥 fechamento correto no padrão yield
-                try:
-                    next(db_gen)
-                except StopIteration:
-                    pass
+            # último pedaço do corpo enviado -> fecha o tempo da requisição
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                registrar()
 
-        logger.info("[MOVLOG] FIM request")
+        try:
+            await self.app(scope, receive, send_movlog)
+
+        except Exception as e:
+            logger.exception("[MOVLOG] ERRO na rota")
+
+            request.state.movlog["status"] = "ERROR"
+            request.state.movlog["descricao"] = str(e)
 
-        return response
\ No newline at end of file
+            raise
+
+        finally:
+            registrar()
+            logger.info("[MOVLOG] FIM request")
@@ -0,0 +1,54 @@
+import time
+from wsh.metrics.metrics import http_duracao, http_em_andamento
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que alimenta o histograma de latência por rota e o
+    medidor de requisições em andamento exibidos em /metrics.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status_code = 500
+        observado = False
+
+        def observar():
+            nonlocal observado
+            if observado:
+                return
+            observado = True
+
+            http_em_andamento.dec()
+            # rótulo pelo template da rota (/putaway/{id}), nunca pelo path cru
+            rota = scope.get("route")
+            http_duracao.observar(
+                time.perf_counter() - inicio,
+                scope["method"],
+                rota.path if rota is not None else "<sem rota>",
+                str(status_code)
+            )
+
+        async def send_metricas(message):
+            nonlocal status_code
+
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+            await send(message)
+
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                observar()
+
+        http_em_andamento.inc()
+        try:
+            await self.app(scope, receive, send_metricas)
+        finally:
+            observar()
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from sqlalchemy import text
 from connection.db_connection import SessionLocal
+from wsh.jobs.jobs import submeter_job, Progresso
 from sqlalchemy.orm import Session
 from fastapi import Request
 
@@ -188,7 +189,20 @@ def to_decimal(valor):
 
 
 @a020_a190_rp.post("/importar/a020_a190")
-def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session = Depends(get_db)):
+def importar_a020_a190(
+    payload: ImportacaoRequest,
+    request: Request,
+    background: bool = False,
+    db: Session = Depends(get_db)
+):
+    if background:
+        job_id = submeter_job("/importar/a020_a190", processar_a020_a190, payload)
+        return {"status": "queued", "job_id": job_id}
+
+    return processar_a020_a190(db, Progresso(movlog=request.state.movlog), payload)
+
+
+def processar_a020_a190(db: Session, progresso: Progresso, payload: ImportacaoRequest):
 
     tipo = payload.tipo.upper()
     inputtype = "national" if tipo == "A020" else "transfer"
@@ -205,6 +219,8 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
         if not linhas_validas:
             return {"status": "OK", "mensagem": "Nenhuma linha válida para processar."}
 
+        progresso.fase("leitura")
+
         # ----------------------------------------------------
         # COLETA CHAVES
         # ----------------------------------------------------
@@ -218,7 +234,7 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
         consulta = text("""
             SELECT *
             FROM whsproductsputaway
-            WHERE reference IN :refs
+            WHERE ReferenceKey IN :refs
               AND Waybill IN :waybills
               AND PN IN :pns
               AND situationregistration <> 'E'
@@ -238,13 +254,6 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
             for r in rows
         }
 
-        # ----------------------------------------------------
-        # PEGA MAX ID UMA VEZ
-        # ----------------------------------------------------
-        max_id = db.execute(
-            text("SELECT COALESCE(MAX(ID), 0) FROM whsproductsputaway")
-        ).scalar()
-
         # ----------------------------------------------------
         # LISTAS DE BATCH
         # ----------------------------------------------------
@@ -281,10 +290,7 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
                     })
 
             else:
-                max_id += 1
-
                 inserts.append({
-                    "id": max_id,
                     "pn": linha.pn,
                     "descricao": descricao,
                     "reference": reference,
@@ -297,6 +303,7 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
         # ----------------------------------------------------
         # EXECUÇÃO EM LOTE
         # ----------------------------------------------------
+        progresso.fase("gravacao")
 
         if updates:
             db.execute(text("""
@@ -307,7 +314,7 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
                     inputtype = :inputtype,
                     situationregistration = 'A',
                     dateregistration = NOW()
-                WHERE reference = :reference
+                WHERE ReferenceKey = :reference
                   AND Waybill = :waybill
                   AND PN = :pn
             """), updates)
@@ -315,22 +322,21 @@ def importar_a020_a190(payload: ImportacaoRequest, request: Request, db: Session
         if inserts:
             db.execute(text("""
                 INSERT INTO whsproductsputaway
-                    (Id, User_id, PN, Description, reference, Qty,
+                    (User_id, PN, Description, reference, Qty,
                      Waybill, processlines, inputtype, datecreate,
                      situationregistration, dateregistration)
                 VALUES
-                    (:id, 0, :pn, :descricao, :reference, :qty,
+                    (0, :pn, :descricao, :reference, :qty,
                      :waybill, :processlines, :inputtype, NOW(),
                      'I', NOW())
             """), inserts)
 
         db.commit()
+        progresso.avancar(len(linhas_validas))
 
-        request.state.movlog = {
-            "inserts": len(inserts),
-            "updates": len(updates),
-            "total": len(linhas_validas)
-        }
+        progresso.movlog["inserts"] = len(inserts)
+        progresso.movlog["updates"] = len(updates)
+        progresso.movlog["total"] = len(linhas_validas)
 
     except Exception as e:
         db.rollback()
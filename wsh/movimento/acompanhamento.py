@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
 from connection.db_connection import SessionLocal
-from datetime import datetime, date
+from wsh.listagem.formatador import compilar_formatador
 
 acompanhamento_rp = APIRouter()
 
@@ -17,6 +17,15 @@ def get_db():
     finally:
         db.close()
 
+CAMPOS_DATA_SEM_HORA = {"grn1", "grn3", "DtLanc"}
+CAMPOS_DATA_COM_HORA = {
+    "DtCreat",
+    "aaf",
+    "DtIni",
+    "DtFim"
+}
+
+
 @acompanhamento_rp.get("/acompanhamento")
 def get_acompanhamento(
     dataini: str,
@@ -24,6 +33,7 @@ def get_acompanhamento(
     processend: int = 0,
     hora: int = 0,
     ordenacao: int = 0,
+    iso: int = 0,
     db: Session = Depends(get_db)
 ):
 
@@ -80,46 +90,12 @@ def get_acompanhamento(
     result = db.execute(
         text(sql),
         {"dataini": dataini, "datafim": datafim}
-    ).fetchall()
-
-    from datetime import datetime, date
-
-    CAMPOS_DATA_SEM_HORA = {"grn1", "grn3"}
-    CAMPOS_DATA_COM_HORA = {
-        "DtCreat",
-        "aaf",
-        "DtIni",
-        "DtFim"
-    }
-
-    CAMPOS_DATA_SO_DATA = {"DtLanc"}
-
-    def formatar_datas(row_dict: dict):
-        for campo, valor in row_dict.items():
-            if not valor:
-                continue
-
-            try:
-                if isinstance(valor, (datetime, date)):
-                    dt = valor
-                else:
-                    dt = datetime.fromisoformat(str(valor))
-
-                if campo in CAMPOS_DATA_SEM_HORA or campo in CAMPOS_DATA_SO_DATA:
-                    row_dict[campo] = dt.strftime("%d/%m/%Y")
-                elif campo in CAMPOS_DATA_COM_HORA:
-                    row_dict[campo] = dt.strftime("%d/%m/%Y %H:%M:%S")
-
-            except Exception:
-                pass
+    )
 
-        return row_dict
+    colunas = list(result.keys())
+    formatar = compilar_formatador(colunas, CAMPOS_DATA_SEM_HORA, CAMPOS_DATA_COM_HORA, iso == 1)
 
-    dados = []
-    for r in result:
-        row_dict = dict(r._mapping)
-        row_dict = formatar_datas(row_dict)
-        dados.append(row_dict)
+    dados = [dict(zip(colunas, formatar(r))) for r in result]
 
     logger.info(f"🚀 Registros encontrados: {len(dados)}")
 
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 import logging
 import json
 from sqlalchemy import text
+from wsh.consulta.campos import projecao, ler_fields
 
 
 putway_rp = APIRouter()
@@ -26,13 +27,18 @@ def get_db():
 #    ROTA 1 — Verificar PN sem lançamento
 #-------------------------------------------------------------------------
 @putway_rp.get("/check-missing")
-def check_missing(ref: str, way: str, db: Session = Depends(get_db)):
+def check_missing(ref: str, way: str, fields: str = "", db: Session = Depends(get_db)):
     logger.info("=== ROTA /check-missing ===")
     logger.info(f"Parâmetros recebidos: ref={ref}, way={way}")
 
+    # operator_id é sempre lido: é dele que sai o multiple_user_ids
+    campos = projecao(db, "whsproductsputaway", fields, obrigatorios=("operator_id",))
+    pedidos = [f.lower() for f in ler_fields(fields)]
+    omitir_operador = bool(pedidos) and "operator_id" not in pedidos
+
     try:
-        sql = text("""
-            SELECT *
+        sql = text(f"""
+            SELECT {campos}
             FROM whsproductsputaway
             WHERE Reference = :ref
               AND Waybill = :way
@@ -68,6 +74,11 @@ def check_missing(ref: str, way: str, db: Session = Depends(get_db)):
                     break  # não precisa continuar, já ac
 
         logger.info(f" multiple user ids: {multiple_user_ids}")
+
+        if omitir_operador:
+            for item in itens:
+                item.pop("operator_id", None)
+
         resposta = {
             "found": len(rows) > 0,
             "count": len(rows),
@@ -99,8 +110,8 @@ def end_log(data: EndLogModel, db: Session = Depends(get_db)):
     sql = text("""
         UPDATE whsproductsputawaylog
         SET DateProcessEnd = NOW()
-        WHERE TRIM(Reference) = :ref AND 
-        TRIM(Waybill) = :way AND 
+        WHERE ReferenceKey = :ref AND 
+        WaybillKey = :way AND 
         User_Id = :user
     """)
 
@@ -145,10 +156,10 @@ def set_operator(data: SetOperatorModel, db: Session = Depends(get_db)):
     sql = text("""
         UPDATE whsproductsputaway
         SET operator_id = :op
-        WHERE TRIM(Reference) = :ref AND Waybill = :way
+        WHERE ReferenceKey = :ref AND WaybillKey = :way
     """)
 
-    db.execute(sql, {"op": data.operator_id, "ref": data.ref.strip(), "way": data.way})
+    db.execute(sql, {"op": data.operator_id, "ref": data.ref.strip(), "way": data.way.strip()})
     db.commit()
 
     return {"updated": True}
@@ -165,7 +176,7 @@ def finalize(data: FinalizeModel, db: Session = Depends(get_db)):
     sql = text("""
         UPDATE whsproductsputaway
         SET DateProcessEnd = NOW()
-        WHERE TRIM(Reference) = :ref AND Waybill = :way
+        WHERE ReferenceKey = :ref AND WaybillKey = :way
     """)
 
     db.execute(sql, {"ref": data.ref.strip(), "way": data.way.strip() })
@@ -218,11 +229,11 @@ def operator_finish(data: OperatorFinishModel, db: Session = Depends(get_db)):
             sql = text("""
                 UPDATE whsproductsputaway
                 SET DateProcessEnd = NOW()
-                WHERE TRIM(Reference) = :ref
-                AND Waybill = :way
+                WHERE ReferenceKey = :ref
+                AND WaybillKey = :way
             """)
             logger.info(f"FINALIZAR PROCESSO: {sql}")
-            db.execute(sql, {"ref": data.reference.strip(), "way": data.waybill})
+            db.execute(sql, {"ref": data.reference.strip(), "way": data.waybill.strip()})
             db.commit()
 
             return {"updated": True, "finalized": True}
@@ -1,12 +1,18 @@
 from fastapi import Depends, APIRouter, HTTPException
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Optional
 from typing import List
 from connection.db_connection import SessionLocal
+from wsh.jobs.jobs import submeter_job, Progresso
+from wsh.api.json_stream import itens_json, lotes_validados
 from sqlalchemy.orm import Session
 from datetime import datetime
 import logging, time
+import os
+import pymysql
+import uuid
 from sqlalchemy import text
 from datetime import date
 
@@ -34,76 +40,318 @@ def get_db():
 logger = logging.getLogger("romaneio")
 logging.basicConfig(level=logging.INFO)
 
+ROMANEIO_CHUNK = 5000
+
+
+def criar_staging_romaneio(cursor):
+    """
+    Tabela temporária da conexão (staging por requisição). Cada linha guarda
+    a ordem original (seq), usada depois para reproduzir a regra item a item
+    do Delphi.
+    """
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_romaneio")
+    cursor.execute("""
+        CREATE TEMPORARY TABLE tmp_romaneio (
+            seq          INT NOT NULL PRIMARY KEY,
+            Reference    VARCHAR(100) NULL,
+            Waybill      VARCHAR(100) NULL,
+            PN           VARCHAR(100) NULL,
+            Description  VARCHAR(255) NULL,
+            Qty          DOUBLE NULL,
+            processlines VARCHAR(50) NULL,
+            acao         CHAR(1) NULL,
+            KEY idx_tmp_romaneio_chave (Reference, Waybill, PN)
+        )
+    """)
+
+
+
+def inserir_staging_romaneio(cursor, items, seq_inicial: int = 1):
+    """Insere um bloco do payload no staging a partir de seq_inicial."""
+    linhas = [
+        (seq, item.referencia.strip(), item.waybill.strip(), item.pn.strip(),
+         item.description.strip(), item.qtd, item.processlines)
+        for seq, item in enumerate(items, start=seq_inicial)
+    ]
+
+    sql = """
+        INSERT INTO tmp_romaneio
+            (seq, Reference, Waybill, PN, Description, Qty, processlines)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+    for pos in range(0, len(linhas), ROMANEIO_CHUNK):
+        cursor.executemany(sql, linhas[pos: pos + ROMANEIO_CHUNK])
+
+    return linhas
+
+
+def carregar_staging_romaneio(cursor, items):
+    criar_staging_romaneio(cursor)
+    return inserir_staging_romaneio(cursor, items)
+
+
+def linhas_staging_romaneio(cursor):
+    """
+    (seq, grupo) do staging na ordem do payload. O grupo é o menor seq da
+    chave (Reference, Waybill, PN) calculado pelo próprio MySQL, então
+    linhas que a collation considera iguais (maiúsculas, acentos, espaços à
+    direita) caem no mesmo grupo, como no WHERE do loop antigo.
+
+    Lê com cursor sem buffer (SSCursor) em blocos de ROMANEIO_CHUNK: o
+    resultado não é montado inteiro no cliente. A conexão fica ocupada até
+    o gerador ser consumido até o fim.
+    """
+    leitura = cursor.connection.cursor(pymysql.cursors.SSCursor)
+    try:
+        leitura.execute("""
+            SELECT seq, MIN(seq) OVER (PARTITION BY Reference, Waybill, PN) AS grupo
+            FROM tmp_romaneio
+            ORDER BY seq
+        """)
+        while True:
+            bloco = leitura.fetchmany(ROMANEIO_CHUNK)
+            if not bloco:
+                return
+            yield from bloco
+    finally:
+        leitura.close()
+
+
+def revised_qty_inserido(cursor):
+    """
+    RevisedQty que o INSERT do romaneio deixa na linha nova (o INSERT não
+    informa a coluna): o DEFAULT da coluna, ou 0 se ela for NOT NULL sem
+    DEFAULT. É o valor que o loop antigo leria ao achar a chave de novo no
+    mesmo payload.
+    """
+    cursor.execute("""
+        SELECT COLUMN_DEFAULT, IS_NULLABLE
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = 'whsproductsputaway'
+          AND COLUMN_NAME = 'RevisedQty'
+    """)
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    padrao, nullable = row
+    if padrao is None:
+        return None if nullable == "YES" else 0
+    try:
+        return float(padrao)
+    except ValueError:
+        return None
+
+
+def classificar_romaneio(cursor):
+    """
+    Decide INSERT / UPDATE / IGNORADO para cada linha do staging.
+
+    O estado atual de todas as chaves é lido com um único SELECT (join com o
+    staging). A regra é aplicada em memória na ordem do payload, exatamente
+    como o loop antigo fazia linha a linha:
+      - chave inexistente        -> INSERT (situação passa a 'I')
+      - RevisedQty == 0 e 'I'    -> UPDATE (situação passa a 'A')
+      - demais casos             -> ignorado
+
+    As chaves são comparadas pelo grupo que o MySQL atribui a cada linha
+    (ver linhas_staging_romaneio), nunca por string em Python.
+
+    Ficam em memória o estado das chaves que já existem e a lista de ações
+    (seq, 'I'/'U') das linhas que serão gravadas; as ignoradas não entram.
+    """
+    cursor.execute("""
+        SELECT s.grupo, p.RevisedQty, p.situationregistration
+        FROM whsproductsputaway p
+        JOIN (
+            SELECT MIN(seq) AS grupo, Reference, Waybill, PN
+            FROM tmp_romaneio
+            GROUP BY Reference, Waybill, PN
+        ) s
+          ON s.Reference = p.ReferenceKey
+         AND s.Waybill = p.WaybillKey
+         AND s.PN = p.PNKey
+        WHERE p.situationregistration <> 'E'
+    """)
+
+    estado = {}
+    for grupo, revised_qty, situation in cursor.fetchall():
+        # igual ao fetchone() antigo: vale o primeiro registro encontrado
+        estado.setdefault(grupo, (revised_qty, situation))
+
+    # chave repetida no payload depois do INSERT: a linha nova tem o
+    # RevisedQty padrão da coluna (lido antes, o cursor fica com o staging)
+    revised_novo = revised_qty_inserido(cursor)
+
+    acoes = []
+    inseridos = atualizados = ignorados = 0
+
+    for seq, grupo in linhas_staging_romaneio(cursor):
+        atual = estado.get(grupo)
+
+        if atual is None:
+            acoes.append((seq, "I"))
+            estado[grupo] = (revised_novo, "I")
+            inseridos += 1
+        elif atual[0] == 0 and atual[1] == "I":
+            acoes.append((seq, "U"))
+            estado[grupo] = (atual[0], "A")
+            atualizados += 1
+        else:
+            ignorados += 1
+
+    return acoes, inseridos, atualizados, ignorados
+
+
+def mesclar_romaneio(cursor):
+    """Classifica o staging e grava os INSERT/UPDATE em whsproductsputaway."""
+    # 2) Classificação (1 SELECT + regra em memória)
+    acoes, inseridos, atualizados, ignorados = classificar_romaneio(cursor)
+
+    # 3) Marca a ação de cada linha no staging (upsert em lote pela PK seq)
+    sql_acao = """
+        INSERT INTO tmp_romaneio (seq, acao)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE acao = VALUES(acao)
+    """
+    for pos in range(0, len(acoes), ROMANEIO_CHUNK):
+        cursor.executemany(sql_acao, acoes[pos: pos + ROMANEIO_CHUNK])
+
+    # 4a) INSERT — chaves novas (antes do UPDATE: uma chave nova repetida
+    #     no payload é inserida e depois atualizada, como no loop antigo)
+    if inseridos:
+        cursor.execute("""
+            INSERT INTO whsproductsputaway
+                (User_id, PN, Description, Reference, Qty, Waybill, processlines,
+                 datecreate, inputtype, situationregistration, dateregistration)
+            SELECT 0, s.PN, s.Description, s.Reference, s.Qty, s.Waybill, s.processlines,
+                   NOW(), 'import', 'I', NOW()
+            FROM tmp_romaneio s
+            WHERE s.acao = 'I'
+            ORDER BY s.seq
+        """)
+
+    # 4b) UPDATE — somente registros ainda como inseridos
+    if atualizados:
+        cursor.execute("""
+            UPDATE whsproductsputaway p
+            JOIN tmp_romaneio s
+              ON s.Reference = p.ReferenceKey
+             AND s.Waybill = p.WaybillKey
+             AND s.PN = p.PNKey
+            SET p.Qty = s.Qty,
+                p.Description = s.Description,
+                p.processlines = s.processlines,
+                p.inputtype = 'import',
+                p.situationregistration = 'A',
+                p.dateregistration = NOW()
+            WHERE s.acao = 'U'
+        """)
+
+    return inseridos, atualizados, ignorados
+
+
 @moviment_rp.post("/romaneio")
 def putaway(items: List[PutawayItem], request: Request, db: Session = Depends(get_db)):
     conn = db.connection().connection
     cursor = conn.cursor()
 
-    total = 0
-    inseridos = 0
-    atualizados = 0
-    ignorados = 0
+    total = len(items)
+    logger.info(f"Recebidos {total} itens do romaneio (staging + merge em lote)")
 
-    for item in items:
-        total += 1
-        logger.info(f"Recebido item: {item}")
+    try:
+        # 1) Staging por requisição
+        carregar_staging_romaneio(cursor, items)
 
-        # Verifica se já existe
-        cursor.execute("""
-            SELECT * FROM whsproductsputaway
-            WHERE Reference=%s AND Waybill=%s AND PN=%s AND situationregistration <> 'E'
-        """, (item.referencia, item.waybill, item.pn))
-        row = cursor.fetchone()
-        logger.info(f"Resultado SELECT: {row}")
-
-        if row:
-            # Pega RevisedQty e situationregistration
-            try:
-                idx_qty = [desc[0] for desc in cursor.description].index("RevisedQty")
-                revised_qty = row[idx_qty]
-            except ValueError:
-                revised_qty = None
-
-            try:
-                idx_sit = [desc[0] for desc in cursor.description].index("situationregistration")
-                situation = row[idx_sit]
-            except ValueError:
-                situation = None
-
-            # logger.info(f"RevisedQty={revised_qty}, situation={situation}")
-
-            # Só atualiza se ainda está como inserido
-            if revised_qty == 0 and situation == 'I':
-                # logger.info("Executando UPDATE...")
-                cursor.execute("""
-                    UPDATE whsproductsputaway
-                    SET Qty=%s, Description=%s, processlines=%s, inputtype='import', situationregistration='A', dateregistration=%s
-                    WHERE Reference=%s AND Waybill=%s AND PN=%s
-                """, (item.qtd, item.description, item.processlines, datetime.now(),
-                      item.referencia.strip(), item.waybill.strip(), item.pn.strip() ))
-                atualizados += 1
-            else:
-                ignorados += 1
-        else:
-            # Faz INSERT
-            # logger.info("Nenhum registro encontrado, executando INSERT...")
-            cursor.execute("SELECT MAX(Id) FROM whsproductsputaway")
-            max_id = cursor.fetchone()[0] or 0
-            new_id = max_id + 1
-            # logger.info(f"Novo Id calculado: {new_id}")
-
-            cursor.execute("""
-                INSERT INTO whsproductsputaway
-                (Id, User_id, PN, Description, Reference, Qty, Waybill, processlines, datecreate, inputtype, situationregistration, dateregistration)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (new_id, 0, item.pn.strip(), item.description.strip(), item.referencia.strip(), item.qtd,
-                  item.waybill.strip(), item.processlines, datetime.now(), 'import', 'I', datetime.now()))
-            inseridos += 1
+        # 2) a 4) Classificação + merge
+        inseridos, atualizados, ignorados = mesclar_romaneio(cursor)
 
-    conn.commit()
+        conn.commit()
+        logger.info("Operação concluída com sucesso.")
+
+    except Exception as e:
+        logger.exception("Erro ao processar romaneio")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        try:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_romaneio")
+        except Exception:
+            pass
+        cursor.close()
+        conn.close()
+
+    request.state.movlog["inserts"] = inseridos
+    request.state.movlog["updates"] = atualizados
+    request.state.movlog["total"] = total
+
+    return {
+        "status": "ok",
+        "total": total,
+        "inseridos": inseridos,
+        "atualizados": atualizados,
+        "ignorados": ignorados
+    }
+
+
+def descartar_staging_romaneio(conn, cursor, rollback: bool):
+    if rollback:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+    try:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_romaneio")
+    except Exception:
+        pass
     cursor.close()
-    conn.close()
-    logger.info("Operação concluída com sucesso.")
+
+
+@moviment_rp.post("/romaneio/stream")
+async def putaway_stream(request: Request):
+    """
+    Mesmo contrato do /romaneio, com o corpo lido aos poucos: cada item é
+    validado ao chegar e vai para o tmp_romaneio em blocos de
+    ROMANEIO_CHUNK. A classificação relê as chaves do próprio staging, então
+    o payload inteiro nunca fica em memória.
+    """
+    db = SessionLocal()
+    conn = cursor = None
+    total = 0
+    sucesso = False
+
+    try:
+        conn = await run_in_threadpool(lambda: db.connection().connection)
+        cursor = conn.cursor()
+        await run_in_threadpool(criar_staging_romaneio, cursor)
+
+        async for lote in lotes_validados(itens_json(request.stream()), PutawayItem, ROMANEIO_CHUNK):
+            await run_in_threadpool(inserir_staging_romaneio, cursor, lote, total + 1)
+            total += len(lote)
+
+        logger.info(f"Recebidos {total} itens do romaneio (stream)")
+
+        inseridos, atualizados, ignorados = await run_in_threadpool(mesclar_romaneio, cursor)
+        await run_in_threadpool(conn.commit)
+        sucesso = True
+        logger.info("Operação concluída com sucesso.")
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        logger.exception("Erro ao processar romaneio")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        if cursor is not None:
+            await run_in_threadpool(descartar_staging_romaneio, conn, cursor, not sucesso)
+        db.close()
 
     request.state.movlog["inserts"] = inseridos
     request.state.movlog["updates"] = atualizados
@@ -117,6 +365,7 @@ def putaway(items: List[PutawayItem], request: Request, db: Session = Depends(ge
         "ignorados": ignorados
     }
 
+
 @moviment_rp.post("/atualiza-posicao")
 def atualiza_posicao(db: Session = Depends(get_db)):
     conn = db.connection().connection
@@ -329,9 +578,29 @@ def listar_tarefas(
 #   IMPORTAÇÃO aurora071
 #--------------------------------------------------------------------------------------
 
-def executar_sql_em_lotes(cursor, conn, sql_template, resultados, chave, lote=5000, lote_min=500):
+def ajustar_lote(lote, afetados, duracao, alvo_ms, lote_min, lote_max):
+    """
+    Calcula o tamanho do próximo lote a partir do custo medido por linha,
+    mirando `alvo_ms` por lote. A variação fica limitada a metade/dobro do
+    lote atual para não oscilar com um lote atípico.
+    """
+    if afetados <= 0:
+        return lote
+
+    if duracao <= 0:
+        ideal = lote * 2
+    else:
+        ideal = afetados * (alvo_ms / 1000) / duracao
+
+    ideal = min(max(ideal, lote / 2), lote * 2)
+    return int(min(max(ideal, lote_min), lote_max))
+
+
+def executar_sql_em_lotes(cursor, conn, sql_template, resultados, chave,
+                          lote=5000, lote_min=500, lote_max=50000, alvo_ms=500, progresso=None):
     total_afetados = 0
     lote_num = 1
+    lotes = []
 
     while True:
         sql = sql_template.format(lote=lote)
@@ -342,147 +611,221 @@ def executar_sql_em_lotes(cursor, conn, sql_template, resultados, chave, lote=50
             duration = time.time() - start
 
             total_afetados += afetados
-            print(f"Lote {lote_num} com {lote} registros: {afetados} afetados em {duration:.2f}s")
+            lotes.append({"lote": lote_num, "tamanho": lote, "afetados": afetados, "ms": round(duration * 1000, 1)})
+            logger.info(f"Lote {lote_num} com {lote} registros: {afetados} afetados em {duration:.2f}s")
+
+            if progresso:
+                progresso.avancar(afetados)
 
             if afetados == 0:
                 break
+
+            lote = ajustar_lote(lote, afetados, duration, alvo_ms, lote_min, lote_max)
             lote_num += 1
 
         except Exception as e:
             conn.rollback()
-            print(f"Erro no lote {lote_num} com {lote} registros: {e}")
+            logger.error(f"Erro no lote {lote_num} com {lote} registros: {e}")
+            lotes.append({"lote": lote_num, "tamanho": lote, "erro": str(e)})
 
             # Se ainda dá para reduzir o lote, tenta novamente
             if lote > lote_min:
                 lote = max(lote // 2, lote_min)
-                print(f"Reduzindo lote para {lote} e tentando novamente...")
+                logger.info(f"Reduzindo lote para {lote} e tentando novamente...")
                 continue
             else:
                 resultados[chave] = f"erro: {str(e)}"
-                break
+                resultados[f"{chave}_lotes"] = lotes
+                return
 
     resultados[chave] = total_afetados
+    resultados[f"{chave}_lotes"] = lotes
 
 #=============================================================================================
 #                 MOVIMENTO aurora071
 #=============================================================================================
+
+# coluna destino -> coluna agregada em tmp_aurora071_grn
+CAMPOS_GRN_AURORA071 = [("grn1", "grn1"), ("grn3", "grn3"), ("GRN", "grn")]
+
+# whsaurora071 / whsauroraaaf / staging_products guardam cada importação com
+# seu lote_id; lotes nunca processados são descartados depois deste prazo
+STAGING_RETENCAO_HORAS = int(os.getenv("STAGING_RETENCAO_HORAS", "24"))
+
+
+def limpar_lotes_antigos(cursor, tabela, coluna_data: str = "dateregistration"):
+    cursor.execute(
+        f"DELETE FROM {tabela} WHERE {coluna_data} < NOW() - INTERVAL %s HOUR",
+        (STAGING_RETENCAO_HORAS,)
+    )
+
+
+def ultimo_lote(cursor, tabela):
+    """
+    Lote mais recente (clientes antigos que não informam o lote_id). Linhas
+    sem lote_id (de antes da coluna) nunca contam como lote.
+    """
+    cursor.execute(f"""
+        SELECT lote_id FROM {tabela}
+        WHERE lote_id IS NOT NULL
+        ORDER BY dateregistration DESC
+        LIMIT 1
+    """)
+    linha = cursor.fetchone()
+    return linha[0] if linha else None
+
+
+def preparar_grn_aurora071(cursor, lote_id):
+    """
+    Agrega as linhas do lote em whsaurora071 uma única vez por
+    (FileRefPrefix, Item), já com os três valores de destino calculados:
+      - grn1 <- TXIssuedate
+      - grn3 <- Receiptdate (somente StockGoodsInwards = 'S')
+      - GRN  <- GRNNo       (somente StockGoodsInwards IN ('G', 'S'))
+    """
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_aurora071_grn")
+    cursor.execute("""
+        CREATE TEMPORARY TABLE tmp_aurora071_grn (PRIMARY KEY (ref, item))
+        SELECT TRIM(FileRefPrefix) AS ref,
+               TRIM(Item) AS item,
+               MAX(TXIssuedate) AS grn1,
+               MAX(CASE WHEN StockGoodsInwards = 'S' THEN Receiptdate END) AS grn3,
+               MAX(CASE WHEN StockGoodsInwards IN ('G', 'S') THEN GRNNo END) AS grn
+        FROM whsaurora071
+        WHERE lote_id = %s
+          AND FileRefPrefix IS NOT NULL
+          AND Item IS NOT NULL
+        GROUP BY TRIM(FileRefPrefix), TRIM(Item)
+    """, (lote_id,))
+
+
+def condicao_grn(alias, fonte, campo, origem, update_geral):
+    # só entra no lote se o valor de origem existe e é diferente do atual
+    condicao = f"({fonte}.{origem} IS NOT NULL AND ({alias}.{campo} IS NULL OR {alias}.{campo} <> {fonte}.{origem})"
+    if not update_geral:
+        condicao += f" AND ({alias}.{campo}='' OR {alias}.{campo} IS NULL)"
+    return condicao + ")"
+
+
+def sql_reconciliar_grn(tabela, update_geral):
+    """
+    Monta o UPDATE em lote que grava grn1, grn3 e GRN juntos, numa única
+    passada pelo join com tmp_aurora071_grn.
+    """
+    condicoes_sub = [
+        condicao_grn("x", "a", campo, origem, update_geral)
+        for campo, origem in CAMPOS_GRN_AURORA071
+    ]
+    condicoes_set = [
+        condicao_grn("p", "t", campo, origem, update_geral)
+        for campo, origem in CAMPOS_GRN_AURORA071
+    ]
+    sets = ",\n                ".join(
+        f"p.{campo} = IF({cond}, t.{origem}, p.{campo})"
+        for (campo, origem), cond in zip(CAMPOS_GRN_AURORA071, condicoes_set)
+    )
+
+    return f"""
+        UPDATE {tabela} p
+            JOIN (
+                SELECT x.Id, a.grn1, a.grn3, a.grn
+                FROM {tabela} x
+                INNER JOIN tmp_aurora071_grn a
+                    ON x.ReferenceKey = a.ref
+                    AND x.PNKey = a.item
+                WHERE {" OR ".join(condicoes_sub)}
+                LIMIT {{lote}}
+            ) AS t ON p.Id = t.Id
+            SET {sets};
+    """
+
+
 @moviment_rp.post("/aurora071/process")
 def processar_aurora071(
     update_geral: bool = False,
     grn_log: bool = False,
+    background: bool = False,
+    lote_id: str = "",
     db: Session = Depends(get_db)
 ):
+    if background:
+        job_id = submeter_job("/aurora071/process", reconciliar_aurora071, update_geral, grn_log, lote_id)
+        return {"status": "queued", "job_id": job_id}
+
+    return reconciliar_aurora071(db, Progresso(), update_geral, grn_log, lote_id)
+
+
+def contar_grn_por_campo(cursor, tabela, update_geral):
+    """
+    Quantas linhas da tabela cada campo (grn1, grn3, GRN) vai alterar, numa
+    única leitura do join antes da passada. A passada só para quando nenhuma
+    condição sobra, então é o que cada UPDATE por campo do loop antigo
+    afetava.
+    """
+    somas = ",\n               ".join(
+        f"COALESCE(SUM({condicao_grn('x', 'a', campo, origem, update_geral)}), 0)"
+        for campo, origem in CAMPOS_GRN_AURORA071
+    )
+    cursor.execute(f"""
+        SELECT {somas}
+        FROM {tabela} x
+        INNER JOIN tmp_aurora071_grn a
+            ON x.ReferenceKey = a.ref
+            AND x.PNKey = a.item
+    """)
+    return [int(v) for v in cursor.fetchone()]
+
+
+def separar_por_campo(resultados, chave_total: str, contagens, chaves):
+    """
+    Contrato antigo da resposta: uma chave por campo (grn1, grn3, grn /
+    log_grn1, log_grn3, log_GRN) com as linhas alteradas naquele campo. Se a
+    passada falhou, cada chave recebe o mesmo erro.
+    """
+    total = resultados[chave_total]
+    for chave, contagem in zip(chaves, contagens):
+        resultados[chave] = total if isinstance(total, str) else contagem
+
+
+def reconciliar_aurora071(db: Session, progresso: Progresso, update_geral: bool, grn_log: bool, lote_id: str = ""):
     conn = db.connection().connection
     cursor = conn.cursor()
     resultados = {}
 
     try:
-        # 🔹 Atualização GRN1
-        # logger.info("➡️ Iniciando atualização GRN1...")
-        condicao = "" if update_geral else "AND (p.grn1='' OR p.grn1 IS NULL)"
-        sql_template = f"""
-            UPDATE whsproductsputaway p
-                JOIN (
-                    SELECT p.Id
-                    FROM whsproductsputaway p
-                    INNER JOIN whsaurora071 a
-                        ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                        AND TRIM(p.PN) = TRIM(a.Item)
-                    WHERE (p.grn1 IS NULL OR p.grn1 <> a.TXIssuedate)
-                        {condicao}
-                    LIMIT {{lote}}
-                ) AS t ON p.Id = t.Id
-                INNER JOIN whsaurora071 a
-                    ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                    AND TRIM(p.PN) = TRIM(a.Item)
-                SET p.grn1 = a.TXIssuedate;
-        """
-        executar_sql_em_lotes(cursor, conn, sql_template, resultados, "grn1")
-        # logger.info("✅ Atualização GRN1 concluída.")
-
-        # 🔹 Atualização GRN3
-        # logger.info("➡️ Iniciando atualização GRN3...")
-        condicao = "" if update_geral else "AND (p.grn3='' OR p.grn3 IS NULL)"
-        sql_template = f"""
-            UPDATE whsproductsputaway p
-                JOIN (
-                    SELECT p.Id
-                    FROM whsproductsputaway p
-                    INNER JOIN whsaurora071 a
-                        ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                        AND TRIM(p.PN) = TRIM(a.Item)
-                    WHERE (StockGoodsInwards = 'S') AND (p.grn3 IS NULL OR p.grn3 <> a.Receiptdate)
-                        {condicao}
-                    LIMIT {{lote}}
-                ) AS t ON p.Id = t.Id
-                INNER JOIN whsaurora071 a
-                    ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                    AND TRIM(p.PN) = TRIM(a.Item)
-                SET p.grn3 = a.Receiptdate;
-        """
-        executar_sql_em_lotes(cursor, conn, sql_template, resultados, "grn3")
-        # logger.info("✅ Atualização GRN3 concluída.")
-
-        # 🔹 Atualização GRN
-        # logger.info("➡️ Iniciando atualização GRN...")
-        condicao = "" if update_geral else "AND (p.GRN='' OR p.GRN IS NULL)"
-        sql_template = f"""
-            UPDATE whsproductsputaway p
-                JOIN (
-                    SELECT DISTINCT p.Id
-                    FROM whsproductsputaway p
-                    INNER JOIN whsaurora071 a
-                        ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                        AND TRIM(p.PN) = TRIM(a.Item)
-                        AND a.StockGoodsInwards IN ('G', 'S')
-                    WHERE (p.GRN IS NULL OR p.GRN <> a.GRNNo)
-                        {condicao}
-                    LIMIT {{lote}}
-                ) AS t ON p.Id = t.Id
-                INNER JOIN whsaurora071 a
-                    ON TRIM(p.reference) = TRIM(a.FileRefPrefix)
-                    AND TRIM(p.PN) = TRIM(a.Item)
-                    AND a.StockGoodsInwards IN ('G', 'S')
-                SET p.GRN = a.GRNNo;
-        """
-        executar_sql_em_lotes(cursor, conn, sql_template, resultados, "grn")
-        # logger.info("✅ Atualização GRN concluída.")
-
-        # 🔹 Atualizações de log
+        # sem lote_id (cliente antigo): processa a última importação
+        if not lote_id:
+            lote_id = ultimo_lote(cursor, "whsaurora071")
+        if not lote_id:
+            raise HTTPException(status_code=400, detail="nenhum lote da aurora071 para processar")
+
+        # 🔹 Agregação única do lote da whsaurora071
+        progresso.fase("agregacao")
+        preparar_grn_aurora071(cursor, lote_id)
+
+        # 🔹 Atualização GRN1 + GRN3 + GRN numa única passada
+        progresso.fase("grn")
+        sql_template = sql_reconciliar_grn("whsproductsputaway", update_geral)
+        executar_sql_em_lotes(cursor, conn, sql_template, resultados, "grn", progresso=progresso)
+        repetir_resultado(resultados, "grn", ("grn1", "grn3"))
+
+        # 🔹 Atualização do log (mesma passada única)
         if grn_log:
-            for campo, coluna in [("grn1", "TXIssuedate"), ("grn3", "Receiptdate"), ("GRN", "GRNNo")]:
-                # logger.info(f"➡️ Iniciando atualização de log {campo}...")
-                condicao = "" if update_geral else f"AND (l.{campo}='' OR l.{campo} IS NULL)"
-                sql_template = f"""
-                    UPDATE whsproductsputawaylog l
-                        JOIN (
-                            SELECT l.Id
-                            FROM whsproductsputawaylog l
-                            INNER JOIN whsaurora071 a
-                                ON TRIM(l.reference) = TRIM(a.FileRefPrefix)
-                                AND TRIM(l.PN) = TRIM(a.Item)
-                            WHERE (l.{campo} IS NULL OR l.{campo} <> a.{coluna})
-                                {condicao}
-                            LIMIT {{lote}}
-                        ) AS t ON l.Id = t.Id
-                        INNER JOIN whsaurora071 a
-                            ON TRIM(l.reference) = TRIM(a.FileRefPrefix)
-                            AND TRIM(l.PN) = TRIM(a.Item)
-                        SET l.{campo} = a.{coluna};
-                """
-                executar_sql_em_lotes(cursor, conn, sql_template, resultados, f"log_{campo}")
-                # logger.info(f"✅ Atualização de log {campo} concluída.")
-
-        # logger.info("➡️ Limpando tabela whsaurora071...")
-        cursor.execute("TRUNCATE TABLE whsaurora071;")
+            progresso.fase("log_grn")
+            sql_template = sql_reconciliar_grn("whsproductsputawaylog", update_geral)
+            executar_sql_em_lotes(cursor, conn, sql_template, resultados, "log_grn", progresso=progresso)
+            repetir_resultado(resultados, "log_grn", ("log_grn1", "log_grn3", "log_GRN"))
+
+        # remove só o lote processado: outras importações seguem intactas
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_aurora071_grn")
+        cursor.execute("DELETE FROM whsaurora071 WHERE lote_id = %s", (lote_id,))
         conn.commit()
-        # logger.info("✅ Tabela whsaurora071 limpa.")
 
     finally:
         cursor.close()
         conn.close()
 
-    return {"status": "ok", "resultados": resultados}
+    return {"status": "ok", "lote_id": lote_id, "resultados": resultados}
 
 #========================================================================================================
 #         MOVIMENTO auroraAAF
@@ -527,8 +870,28 @@ def processar_auroraAAF(
     update_geral: bool = False,
     aaf_log: bool = False,
     aaf_tela: bool = False,
+    background: bool = False,
     linhas: list[dict] = None,
     db: Session = Depends(get_db)
+):
+    if background:
+        job_id = submeter_job(
+            "/auroraAAF/process", aplicar_auroraAAF, update_geral, aaf_log, aaf_tela, linhas
+        )
+        return {"status": "queued", "job_id": job_id}
+
+    return aplicar_auroraAAF(
+        db, Progresso(movlog=request.state.movlog), update_geral, aaf_log, aaf_tela, linhas
+    )
+
+
+def aplicar_auroraAAF(
+    db: Session,
+    progresso: Progresso,
+    update_geral: bool,
+    aaf_log: bool,
+    aaf_tela: bool,
+    linhas: list[dict]
 ):
     conn = db.connection().connection
     cursor = conn.cursor()
@@ -540,13 +903,17 @@ def processar_auroraAAF(
     # 🔹 CONTROLE REAL DE AFETADOS
     refs_atualizadas = set()
 
+    lote_id = progresso.job_id or str(uuid.uuid4())
+
     try:
-        cursor.execute("TRUNCATE TABLE whsauroraaaf")
+        # as linhas desta execução ficam no seu lote_id; só lotes vencidos saem
+        limpar_lotes_antigos(cursor, "whsauroraaaf")
         conn.commit()
 
         # ==================================================
         # 1️⃣ INSERÇÃO NA whsauroraaaf (IGUAL DELPHI)
         # ==================================================
+        progresso.fase("importacao")
         if linhas:
             for linha in linhas:
                 # Regra idêntica ao Delphi
@@ -554,6 +921,7 @@ def processar_auroraAAF(
 
                     cursor.execute("""
                         INSERT INTO whsauroraaaf (
+                            lote_id,
                             reference,
                             Waybill,
                             aaf,
@@ -562,8 +930,9 @@ def processar_auroraAAF(
                             ImportRefCode,
                             situationregistration,
                             dateregistration
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
                     """, (
+                        lote_id,
                         linha.get("reference").strip(),
                         linha.get("Waybill").strip(),
                         linha.get("aaf").strip(),
@@ -578,6 +947,7 @@ def processar_auroraAAF(
         # ==================================================
         # 2️⃣ ATUALIZAÇÃO whsproductsputaway
         # ==================================================
+        progresso.fase("atualizacao")
         if aaf_tela and linhas:
             for idx, linha in enumerate(linhas, start=1):
                 sql = """
@@ -601,6 +971,7 @@ def processar_auroraAAF(
                 afetados = executar_sql( cursor, conn, sql, resultados, f"aaf_tela_{idx}", params )
 
                 linhas_fisicas_afetadas += afetados
+                progresso.avancar(afetados)
 
                 # 🔹 CONTA SOMENTE UMA VEZ POR REFERENCE
                 if afetados > 0:
@@ -622,6 +993,7 @@ def processar_auroraAAF(
         # ==================================================
         # 3️⃣ CONFERÊNCIA FINAL (BASEADA NA whsauroraaaf)
         # ==================================================
+        progresso.fase("conferencia")
         cursor.execute("""
             SELECT
                 a.reference,
@@ -633,9 +1005,10 @@ def processar_auroraAAF(
             FROM whsauroraaaf a
             LEFT JOIN whsproductsputaway p
                 ON p.reference = a.reference
-            WHERE a.situationregistration = 'I'
+            WHERE a.lote_id = %s
+              AND a.situationregistration = 'I'
             ORDER BY a.reference
-        """)
+        """, (lote_id,))
 
         hoje = date.today()
 
@@ -675,18 +1048,27 @@ def processar_auroraAAF(
             })
 
     finally:
+        # o lote só serve para a conferência desta execução
+        try:
+            conn.rollback()
+            cursor.execute("DELETE FROM whsauroraaaf WHERE lote_id = %s", (lote_id,))
+            conn.commit()
+        except Exception:
+            logger.exception(f"Erro ao remover o lote {lote_id} da whsauroraaaf")
+
         cursor.close()
         conn.close()
 
-        request.state.movlog["inserts"] = 0
-        request.state.movlog["updates"] = len(refs_atualizadas)
-        request.state.movlog["total"] = len(linhas_fisicas_afetadas)
+        progresso.movlog["inserts"] = 0
+        progresso.movlog["updates"] = len(refs_atualizadas)
+        progresso.movlog["total"] = linhas_fisicas_afetadas
 
     # ==================================================
     # 4️⃣ RETORNO PARA O DELPHI
     # ==================================================
     return {
         "status": "ok",
+        "lote_id": lote_id,
         "total_afetados": len(refs_atualizadas),
         "linhas_fisicas_afetadas": linhas_fisicas_afetadas,
         "detalhes": resultados,
@@ -725,8 +1107,8 @@ def atribuir_operador(
             sql_update = f"""
                 UPDATE whsproductsputaway
                 SET operator_id = '{operador}'
-                WHERE TRIM(Reference) = TRIM('{reference}')
-                  AND TRIM(Waybill) = TRIM('{waybill}')
+                WHERE ReferenceKey = TRIM('{reference}')
+                  AND WaybillKey = TRIM('{waybill}')
             """
             cursor.execute(sql_update)
             conn.commit()
@@ -1123,18 +1505,25 @@ def import_whsaurora071(
     request: Request,
     db: Session = Depends(get_db)
 ):
+    lote_id = str(uuid.uuid4())
+
     try:
-        # Limpa a tabela antes da importação
-        db.execute(text("TRUNCATE TABLE whsaurora071"))
+        # cada importação grava no seu lote_id (sem TRUNCATE: importações de
+        # sites diferentes podem rodar juntas); lotes vencidos são removidos
+        cursor = db.connection().connection.cursor()
+        try:
+            limpar_lotes_antigos(cursor, "whsaurora071")
+        finally:
+            cursor.close()
 
         # SQL ajustado com INSERT IGNORE
         sql = text("""
             INSERT IGNORE INTO whsaurora071
-            (DocType, FileRef, Item, StockGoodsInwards,
+            (lote_id, DocType, FileRef, Item, StockGoodsInwards,
              Receiptdate, TXIssuedate, GRNNo, PMP,
              situationregistration, dateregistration)
             VALUES
-            (:DocType, :FileRef, :Item, :StockGoodsInwards,
+            (:lote_id, :DocType, :FileRef, :Item, :StockGoodsInwards,
              :Receiptdate, :TXIssuedate, :GRNNo, :PMP,
              'I', NOW())
         """)
@@ -1160,7 +1549,7 @@ def import_whsaurora071(
                 continue
             chaves.add(chave)
 
-            db.execute(sql, item.model_dump())
+            db.execute(sql, {**item.model_dump(), "lote_id": lote_id})
             registros_salvos += 1
 
         db.commit()
@@ -1171,7 +1560,8 @@ def import_whsaurora071(
 
         return {
             "status": "ok",
-            "records": registros_salvos
+            "records": registros_salvos,
+            "lote_id": lote_id
         }
 
     except Exception as e:
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from connection.db_connection import Base, engine, SessionLocal
 import logging
+from wsh.consulta.campos import projecao
 
 user_rp = APIRouter()
 logging.basicConfig(level=logging.INFO)
@@ -20,10 +21,12 @@ def get_db():
 
 # 🔹 ROTA: Buscar usuário por login
 @user_rp.get("/user")
-def get_caduser(usuario: str, db: Session = Depends(get_db)):
+def get_caduser(usuario: str, fields: str = "", db: Session = Depends(get_db)):
 
-    sql = text("""
-        SELECT *
+    campos = projecao(db, "caduser", fields)
+
+    sql = text(f"""
+        SELECT {campos}
         FROM caduser
         WHERE users = :usuario
           AND situationregistration <> 'E'